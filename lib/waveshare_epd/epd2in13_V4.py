@@ -1,17 +1,22 @@
+import time
 import logging
 from . import epdconfig
 
 EPD_WIDTH       = 122
 EPD_HEIGHT      = 250
+# A full refresh takes about 2 s; BUSY held longer than this means the panel is stuck
+BUSY_TIMEOUT    = 10
 
 logger = logging.getLogger(__name__)
 
 class EPD:
-    def __init__(self):
-        self.reset_pin = epdconfig.RST_PIN
-        self.dc_pin = epdconfig.DC_PIN
-        self.busy_pin = epdconfig.BUSY_PIN
-        self.cs_pin = epdconfig.CS_PIN
+    def __init__(self, config=None):
+        # config: board implementation from epdconfig.create(), defaults to the module
+        self.config = config if config is not None else epdconfig
+        self.reset_pin = self.config.RST_PIN
+        self.dc_pin = self.config.DC_PIN
+        self.busy_pin = self.config.BUSY_PIN
+        self.cs_pin = self.config.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
 
@@ -20,12 +25,12 @@ class EPD:
     parameter:
     '''
     def reset(self):
-        epdconfig.digital_write(self.reset_pin, 1)
-        epdconfig.delay_ms(20) 
-        epdconfig.digital_write(self.reset_pin, 0)
-        epdconfig.delay_ms(2)
-        epdconfig.digital_write(self.reset_pin, 1)
-        epdconfig.delay_ms(20)   
+        self.config.digital_write(self.reset_pin, 1)
+        self.config.delay_ms(20) 
+        self.config.digital_write(self.reset_pin, 0)
+        self.config.delay_ms(2)
+        self.config.digital_write(self.reset_pin, 1)
+        self.config.delay_ms(20)   
 
     '''
     function :send command
@@ -33,10 +38,12 @@ class EPD:
      command : Command register
     '''
     def send_command(self, command):
-        epdconfig.digital_write(self.dc_pin, 0)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([command])
-        epdconfig.digital_write(self.cs_pin, 1)
+        # Panels sharing DC and the bus take turns per transaction
+        with self.config.lock:
+            self.config.digital_write(self.dc_pin, 0)
+            self.config.digital_write(self.cs_pin, 0)
+            self.config.spi_writebyte([command])
+            self.config.digital_write(self.cs_pin, 1)
 
     '''
     function :send data
@@ -44,17 +51,19 @@ class EPD:
      data : Write data
     '''
     def send_data(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([data])
-        epdconfig.digital_write(self.cs_pin, 1)
+        with self.config.lock:
+            self.config.digital_write(self.dc_pin, 1)
+            self.config.digital_write(self.cs_pin, 0)
+            self.config.spi_writebyte([data])
+            self.config.digital_write(self.cs_pin, 1)
 
     # send a lot of data   
     def send_data2(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte2(data)
-        epdconfig.digital_write(self.cs_pin, 1)
+        with self.config.lock:
+            self.config.digital_write(self.dc_pin, 1)
+            self.config.digital_write(self.cs_pin, 0)
+            self.config.spi_writebyte2(data)
+            self.config.digital_write(self.cs_pin, 1)
 
     '''
     function :Wait until the busy_pin goes LOW
@@ -62,8 +71,11 @@ class EPD:
     '''
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(10)  
+        deadline = time.monotonic() + BUSY_TIMEOUT
+        while(self.config.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"e-Paper busy for more than {BUSY_TIMEOUT} s")
+            self.config.delay_ms(10)  
         logger.debug("e-Paper busy release")
 
     '''
@@ -137,7 +149,7 @@ class EPD:
     parameter:
     '''
     def init(self):
-        if (epdconfig.module_init() != 0):
+        if (self.config.module_init() != 0):
             return -1
         # EPD hardware init start
         self.reset()
@@ -176,7 +188,7 @@ class EPD:
     parameter:
     '''
     def init_fast(self):
-        if (epdconfig.module_init() != 0):
+        if (self.config.module_init() != 0):
             return -1
         # EPD hardware init start
         self.reset()
@@ -254,9 +266,9 @@ class EPD:
         image : Image data
     '''
     def displayPartial(self, image):
-        epdconfig.digital_write(self.reset_pin, 0)
-        epdconfig.delay_ms(1)
-        epdconfig.digital_write(self.reset_pin, 1)  
+        self.config.digital_write(self.reset_pin, 0)
+        self.config.delay_ms(1)
+        self.config.digital_write(self.reset_pin, 1)  
 
         self.send_command(0x3C) # BorderWavefrom
         self.send_data(0x80)
@@ -276,12 +288,75 @@ class EPD:
         self.send_data2(image)  
         self.TurnOnDisplayPart()
 
+    '''
+    function : Sends one window of the image buffer to e-Paper and partial refresh
+    parameter:
+        image : Full image buffer (as returned by getbuffer)
+        x_start, y_start : Window start, x must be a multiple of 8
+        x_end, y_end : Window end (inclusive)
+    '''
+    def displayPartialWindow(self, image, x_start, y_start, x_end, y_end):
+        self.config.digital_write(self.reset_pin, 0)
+        self.config.delay_ms(1)
+        self.config.digital_write(self.reset_pin, 1)
+
+        self.send_command(0x3C) # BorderWavefrom
+        self.send_data(0x80)
+
+        self.send_command(0x01) # Driver output control
+        self.send_data(0xF9)
+        self.send_data(0x00)
+        self.send_data(0x00)
+
+        self.send_command(0x11) # data entry mode
+        self.send_data(0x03)
+
+        self.SetWindow(x_start, y_start, x_end, y_end)
+        self.SetCursor(x_start >> 3, y_start)
+
+        if self.width%8 == 0:
+            linewidth = int(self.width/8)
+        else:
+            linewidth = int(self.width/8) + 1
+        window = bytearray()
+        for y in range(y_start, y_end + 1):
+            row = y * linewidth
+            window += image[row + (x_start >> 3):row + (x_end >> 3) + 1]
+
+        self.send_command(0x24) # WRITE_RAM
+        self.send_data2(window)
+        self.TurnOnDisplayPart()
+
+        # Restore the full RAM window, so whole-buffer writes do not wrap inside this one
+        self.SetWindow(0, 0, self.width - 1, self.height - 1)
+        self.SetCursor(0, 0)
+
+    '''
+    function : Writes a base image to both RAMs without refreshing,
+               so partial refreshes have a reference after init
+    parameter:
+        image : Image data
+    '''
+    def SetBaseImage(self, image):
+        self.SetWindow(0, 0, self.width - 1, self.height - 1)
+        self.SetCursor(0, 0)
+
+        self.send_command(0x24)
+        self.send_data2(image)
+
+        self.send_command(0x26)
+        self.send_data2(image)
+
     '''
     function : Refresh a base image
     parameter:
         image : Image data
     '''
     def displayPartBaseImage(self, image):
+        # A partial window refresh may have left a smaller RAM window set
+        self.SetWindow(0, 0, self.width - 1, self.height - 1)
+        self.SetCursor(0, 0)
+
         self.send_command(0x24)
         self.send_data2(image)  
 
@@ -312,5 +387,5 @@ class EPD:
         self.send_command(0x10) #enter deep sleep
         self.send_data(0x01)
 
-        epdconfig.delay_ms(2000)
-        epdconfig.module_exit()
+        self.config.delay_ms(2000)
+        self.config.module_exit()
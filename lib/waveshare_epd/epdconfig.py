@@ -2,12 +2,123 @@ import os
 import logging
 import sys
 import time
+import threading
 import subprocess
 
 from ctypes import *
 
 logger = logging.getLogger(__name__)
 
+PIN_NAMES = ('RST_PIN', 'DC_PIN', 'CS_PIN', 'BUSY_PIN', 'PWR_PIN')
+
+
+SPIDEV_BUFSIZ_PATH = '/sys/module/spidev/parameters/bufsiz'
+
+
+def spidev_bufsiz():
+    # Largest single transfer the spidev driver accepts (module parameter, default 4096)
+    try:
+        with open(SPIDEV_BUFSIZ_PATH) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 4096
+
+
+def spi_write_chunked(spi, data, chunk_size):
+    # Write-only bulk transfer: one ioctl per chunk and no read-back, unlike xfer*
+    data = bytes(data)
+    for i in range(0, len(data), chunk_size):
+        spi.writebytes2(data[i:i + chunk_size])
+
+
+# Panels usually share DC, PWR and the SPI bus and differ only in CS, BUSY and
+# RST. A line or SPI device can be claimed only once per process, so every
+# panel's implementation shares one handle per line and device.
+_shared = {}
+_shared_lock = threading.Lock()
+# Panel instances that currently drive each output line (module_init..module_exit)
+_line_users = {}
+_bus_locks = {}
+
+
+def claim(key, factory):
+    # Returns the shared handle for key, creating it on first use
+    with _shared_lock:
+        entry = _shared.get(key)
+        if entry is None:
+            entry = _shared[key] = [factory(), 0]
+        entry[1] += 1
+        return entry[0]
+
+
+def release(key, close):
+    # Drops one claim; the last one closes the handle
+    with _shared_lock:
+        entry = _shared.get(key)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _shared[key]
+            close(entry[0])
+
+
+def bus_lock(spi_bus):
+    '''
+    Lock held for each command or data transaction, so panels sharing the
+    DC line and the bus never interleave their bytes.
+    '''
+    with _shared_lock:
+        return _bus_locks.setdefault(spi_bus, threading.RLock())
+
+
+def use_lines(owner, pins):
+    with _shared_lock:
+        for pin in pins:
+            _line_users.setdefault(pin, set()).add(id(owner))
+
+
+def unuse_lines(owner, pins):
+    # Returns the pins no other panel is still using, which may be switched off
+    unused = []
+    with _shared_lock:
+        for pin in pins:
+            users = _line_users.get(pin, set())
+            users.discard(id(owner))
+            if not users:
+                unused.append(pin)
+    return unused
+
+
+class SharedSpi:
+    # One spidev handle per bus and chip select, opened while any panel uses it
+    def __init__(self, spi_bus, spi_device):
+        import spidev
+        self.spi_bus = spi_bus
+        self.spi_device = spi_device
+        self.spi = spidev.SpiDev()
+        self.users = 0
+
+    def open(self):
+        if self.users == 0:
+            self.spi.open(self.spi_bus, self.spi_device)
+            self.spi.max_speed_hz = 4000000
+            self.spi.mode = 0b00
+        self.users += 1
+
+    def close(self):
+        self.users -= 1
+        if self.users == 0:
+            self.spi.close()
+
+
+def apply_pins(board, pins):
+    # Per-instance overrides of the class-level pin map
+    for name, value in (pins or {}).items():
+        if name not in PIN_NAMES:
+            raise ValueError('Unknown pin name: %s' % name)
+        setattr(board, name, value)
+
 
 class RaspberryPi:
     # Pin definition
@@ -19,16 +130,22 @@ class RaspberryPi:
     MOSI_PIN = 10
     SCLK_PIN = 11
 
-    def __init__(self):
-        import spidev
+    def __init__(self, pins=None, spi_bus=0, spi_device=0):
         import gpiozero
 
-        self.SPI = spidev.SpiDev()
-        self.GPIO_RST_PIN    = gpiozero.LED(self.RST_PIN)
-        self.GPIO_DC_PIN     = gpiozero.LED(self.DC_PIN)
+        apply_pins(self, pins)
+        self.spi_bus = spi_bus
+        self.spi_device = spi_device
+        self.lock = bus_lock(spi_bus)
+        self.spi_open = False
+        # Shared with other panels on the same lines and device
+        self.shared_spi = claim(('spi', spi_bus, spi_device), lambda: SharedSpi(spi_bus, spi_device))
+        self.SPI = self.shared_spi.spi
+        self.GPIO_RST_PIN    = claim(('out', self.RST_PIN), lambda: gpiozero.LED(self.RST_PIN))
+        self.GPIO_DC_PIN     = claim(('out', self.DC_PIN), lambda: gpiozero.LED(self.DC_PIN))
         # self.GPIO_CS_PIN     = gpiozero.LED(self.CS_PIN)
-        self.GPIO_PWR_PIN    = gpiozero.LED(self.PWR_PIN)
-        self.GPIO_BUSY_PIN   = gpiozero.Button(self.BUSY_PIN, pull_up = False)
+        self.GPIO_PWR_PIN    = claim(('out', self.PWR_PIN), lambda: gpiozero.LED(self.PWR_PIN))
+        self.GPIO_BUSY_PIN   = claim(('in', self.BUSY_PIN), lambda: gpiozero.Button(self.BUSY_PIN, pull_up = False))
 
 
 
@@ -58,13 +175,13 @@ class RaspberryPi:
         if pin == self.BUSY_PIN:
             return self.GPIO_BUSY_PIN.value
         elif pin == self.RST_PIN:
-            return self.RST_PIN.value
+            return self.GPIO_RST_PIN.value
         elif pin == self.DC_PIN:
-            return self.DC_PIN.value
+            return self.GPIO_DC_PIN.value
         # elif pin == self.CS_PIN:
-        #     return self.CS_PIN.value
+        #     return self.GPIO_CS_PIN.value
         elif pin == self.PWR_PIN:
-            return self.PWR_PIN.value
+            return self.GPIO_PWR_PIN.value
 
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
@@ -85,6 +202,7 @@ class RaspberryPi:
         return self.DEV_SPI.DEV_SPI_ReadData()
 
     def module_init(self, cleanup=False):
+        use_lines(self, (self.RST_PIN, self.DC_PIN, self.PWR_PIN))
         self.GPIO_PWR_PIN.on()
 
         if cleanup:
@@ -110,30 +228,137 @@ class RaspberryPi:
             self.DEV_SPI.DEV_Module_Init()
 
         else:
-            # SPI device, bus = 0, device = 0
-            self.SPI.open(0, 0)
-            self.SPI.max_speed_hz = 4000000
-            self.SPI.mode = 0b00
+            # SPI device, bus = 0, device = 0 unless overridden
+            if not self.spi_open:
+                self.shared_spi.open()
+                self.spi_open = True
         return 0
 
     def module_exit(self, cleanup=False):
         logger.debug("spi end")
-        self.SPI.close()
-
-        self.GPIO_RST_PIN.off()
-        self.GPIO_DC_PIN.off()
-        self.GPIO_PWR_PIN.off()
+        if self.spi_open:
+            self.shared_spi.close()
+            self.spi_open = False
+
+        # Lines another panel still uses stay as they are
+        devices = {self.RST_PIN: self.GPIO_RST_PIN, self.DC_PIN: self.GPIO_DC_PIN, self.PWR_PIN: self.GPIO_PWR_PIN}
+        with self.lock:
+            for pin in unuse_lines(self, devices):
+                devices[pin].off()
         logger.debug("close 5V, Module enters 0 power consumption ...")
 
         if cleanup:
-            self.GPIO_RST_PIN.close()
-            self.GPIO_DC_PIN.close()
+            for key in (('out', self.RST_PIN), ('out', self.DC_PIN), ('out', self.PWR_PIN), ('in', self.BUSY_PIN)):
+                release(key, lambda device: device.close())
             # self.GPIO_CS_PIN.close()
-            self.GPIO_PWR_PIN.close()
-            self.GPIO_BUSY_PIN.close()
+            release(('spi', self.spi_bus, self.spi_device), lambda spi: None)
+
+
+
+
+
+
+class GpiodLine:
+    # One requested line, shared by the panels using it, with its last written value
+    def __init__(self, request, pin, value=0):
+        self.request = request
+        self.pin = pin
+        self.value = value
+
+
+class RaspberryPiGpiod(RaspberryPi):
+    '''
+    Raspberry Pi backend on the GPIO character device (libgpiod v2 bindings).
+    RST/DC/PWR/BUSY are each requested once per process and shared by the
+    panels using them; writes that do not change a line are skipped, so the
+    DC toggles around every send_data() cost nothing after the first.
+    Select with EPD_GPIO_BACKEND=gpiod.
+    '''
+    CHIP_LABELS = ('pinctrl-bcm2835', 'pinctrl-bcm2711', 'pinctrl-rp1')
+
+    def __init__(self, pins=None, spi_bus=0, spi_device=0):
+        import gpiod
+        from gpiod.line import Direction, Value, Bias
+
+        apply_pins(self, pins)
+        self.spi_bus = spi_bus
+        self.spi_device = spi_device
+        self.lock = bus_lock(spi_bus)
+        self.spi_open = False
+        self.shared_spi = claim(('spi', spi_bus, spi_device), lambda: SharedSpi(spi_bus, spi_device))
+        self.SPI = self.shared_spi.spi
+
+        self.ACTIVE = Value.ACTIVE
+        self.INACTIVE = Value.INACTIVE
+        chip = self.find_chip(gpiod)
+
+        def request(pin, settings):
+            return lambda: GpiodLine(gpiod.request_lines(chip, consumer='waveshare_epd', config={pin: settings}), pin)
+
+        output = gpiod.LineSettings(direction=Direction.OUTPUT, output_value=Value.INACTIVE)
+        # Output lines by pin
+        self.lines = {
+            pin: claim(('gpiod', chip, pin), request(pin, output))
+            for pin in (self.RST_PIN, self.DC_PIN, self.PWR_PIN)
+        }
+        self.busy_line = claim(('gpiod', chip, self.BUSY_PIN), request(
+            self.BUSY_PIN, gpiod.LineSettings(direction=Direction.INPUT, bias=Bias.PULL_DOWN)))
+        self.chip = chip
+
+    def find_chip(self, gpiod):
+        chip_path = os.environ.get('EPD_GPIOCHIP')
+        if chip_path:
+            return chip_path
+        for name in sorted(os.listdir('/dev')):
+            if not name.startswith('gpiochip'):
+                continue
+            path = os.path.join('/dev', name)
+            with gpiod.Chip(path) as chip:
+                if chip.get_info().label in self.CHIP_LABELS:
+                    return path
+        return '/dev/gpiochip0'
 
+    def digital_write(self, pin, value):
+        value = 1 if value else 0
+        line = self.lines.get(pin)
+        # CS is driven by the SPI controller, and unchanged lines need no syscall
+        if line is None or line.value == value:
+            return
+        line.request.set_value(pin, self.ACTIVE if value else self.INACTIVE)
+        line.value = value
 
+    def digital_read(self, pin):
+        if pin in self.lines:
+            return self.lines[pin].value
+        if pin == self.BUSY_PIN:
+            return 1 if self.busy_line.request.get_value(pin) == self.ACTIVE else 0
+        return 0
 
+    def module_init(self, cleanup=False):
+        use_lines(self, self.lines)
+        self.digital_write(self.PWR_PIN, 1)
+        # SPI device, bus = 0, device = 0 unless overridden
+        if not self.spi_open:
+            self.shared_spi.open()
+            self.spi_open = True
+        return 0
+
+    def module_exit(self, cleanup=False):
+        logger.debug("spi end")
+        if self.spi_open:
+            self.shared_spi.close()
+            self.spi_open = False
+
+        # Lines another panel still uses stay as they are
+        with self.lock:
+            for pin in unuse_lines(self, self.lines):
+                self.digital_write(pin, 0)
+        logger.debug("close 5V, Module enters 0 power consumption ...")
+
+        if cleanup:
+            for pin in list(self.lines) + [self.BUSY_PIN]:
+                release(('gpiod', self.chip, pin), lambda line: line.request.release())
+            release(('spi', self.spi_bus, self.spi_device), lambda spi: None)
 
 
 class JetsonNano:
@@ -144,25 +369,50 @@ class JetsonNano:
     BUSY_PIN = 24
     PWR_PIN  = 18
 
-    def __init__(self):
+    def __init__(self, pins=None, spi_bus=0, spi_device=0):
         import ctypes
-        find_dirs = [
-            os.path.dirname(os.path.realpath(__file__)),
-            '/usr/local/lib',
-            '/usr/lib',
-        ]
+        apply_pins(self, pins)
+        self.spi_bus = spi_bus
+        self.spi_device = spi_device
+        self.lock = bus_lock(spi_bus)
+        self.spidev = None
         self.SPI = None
-        for find_dir in find_dirs:
-            so_filename = os.path.join(find_dir, 'sysfs_software_spi.so')
-            if os.path.exists(so_filename):
-                self.SPI = ctypes.cdll.LoadLibrary(so_filename)
-                break
-        if self.SPI is None:
-            raise RuntimeError('Cannot find sysfs_software_spi.so')
+
+        # Prefer the kernel SPI driver when it is enabled (jetson-io): whole
+        # buffers go out in a few ioctls and chip select is driven in hardware
+        if os.path.exists('/dev/spidev%d.%d' % (spi_bus, spi_device)):
+            try:
+                import spidev
+                self.spidev = spidev.SpiDev()
+                self.spi_chunk = spidev_bufsiz()
+            except ImportError:
+                self.spidev = None
+
+        if self.spidev is None:
+            # Software SPI: chip select is driven through CS_PIN
+            find_dirs = [
+                os.path.dirname(os.path.realpath(__file__)),
+                '/usr/local/lib',
+                '/usr/lib',
+            ]
+            for find_dir in find_dirs:
+                so_filename = os.path.join(find_dir, 'sysfs_software_spi.so')
+                if os.path.exists(so_filename):
+                    self.SPI = ctypes.cdll.LoadLibrary(so_filename)
+                    break
+            if self.SPI is None:
+                raise RuntimeError('Cannot find sysfs_software_spi.so')
+            # Resolve the symbol once and skip ctypes' argument guessing per byte
+            self.spi_transfer = self.SPI.SYSFS_software_spi_transfer
+            self.spi_transfer.argtypes = [ctypes.c_uint8]
+            self.spi_transfer.restype = ctypes.c_uint8
         import Jetson.GPIO
         self.GPIO = Jetson.GPIO
 
     def digital_write(self, pin, value):
+        if pin == self.CS_PIN and self.spidev is not None:
+            # Hardware chip select; the pin belongs to the SPI controller
+            return
         self.GPIO.output(pin, value)
 
     def digital_read(self, pin):
@@ -172,36 +422,56 @@ class JetsonNano:
         time.sleep(delaytime / 1000.0)
 
     def spi_writebyte(self, data):
-        self.SPI.SYSFS_software_spi_transfer(data[0])
+        if self.spidev is not None:
+            self.spidev.writebytes(data)
+        else:
+            self.spi_transfer(data[0])
 
     def spi_writebyte2(self, data):
-        for i in range(len(data)):
-            self.SPI.SYSFS_software_spi_transfer(data[i])
+        if self.spidev is not None:
+            spi_write_chunked(self.spidev, data, self.spi_chunk)
+            return
+        # The software SPI library only exposes a per-byte transfer
+        transfer = self.spi_transfer
+        for value in bytes(data):
+            transfer(value)
 
     def module_init(self):
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
         self.GPIO.setup(self.RST_PIN, self.GPIO.OUT)
         self.GPIO.setup(self.DC_PIN, self.GPIO.OUT)
-        self.GPIO.setup(self.CS_PIN, self.GPIO.OUT)
+        if self.spidev is None:
+            self.GPIO.setup(self.CS_PIN, self.GPIO.OUT)
         self.GPIO.setup(self.PWR_PIN, self.GPIO.OUT)
         self.GPIO.setup(self.BUSY_PIN, self.GPIO.IN)
 
         self.GPIO.output(self.PWR_PIN, 1)
 
-        self.SPI.SYSFS_software_spi_begin()
+        if self.spidev is not None:
+            self.spidev.open(self.spi_bus, self.spi_device)
+            self.spidev.max_speed_hz = 4000000
+            self.spidev.mode = 0b00
+        else:
+            self.SPI.SYSFS_software_spi_begin()
         return 0
 
     def module_exit(self):
         logger.debug("spi end")
-        self.SPI.SYSFS_software_spi_end()
+        if self.spidev is not None:
+            self.spidev.close()
+        else:
+            self.SPI.SYSFS_software_spi_end()
 
         logger.debug("close 5V, Module enters 0 power consumption ...")
         self.GPIO.output(self.RST_PIN, 0)
         self.GPIO.output(self.DC_PIN, 0)
         self.GPIO.output(self.PWR_PIN, 0)
 
-        self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN, self.PWR_PIN])
+        pins = [self.RST_PIN, self.DC_PIN, self.BUSY_PIN, self.PWR_PIN]
+        if self.spidev is None:
+            pins.append(self.CS_PIN)
+        self.GPIO.cleanup(pins)
 
 
 class SunriseX3:
@@ -213,10 +483,15 @@ class SunriseX3:
     PWR_PIN  = 18
     Flag     = 0
 
-    def __init__(self):
+    def __init__(self, pins=None, spi_bus=2, spi_device=0):
         import spidev
         import Hobot.GPIO
 
+        apply_pins(self, pins)
+        self.spi_bus = spi_bus
+        self.spi_device = spi_device
+        self.lock = bus_lock(spi_bus)
+        self.spi_chunk = spidev_bufsiz()
         self.GPIO = Hobot.GPIO
         self.SPI = spidev.SpiDev()
 
@@ -233,9 +508,7 @@ class SunriseX3:
         self.SPI.writebytes(data)
 
     def spi_writebyte2(self, data):
-        # for i in range(len(data)):
-        #     self.SPI.writebytes([data[i]])
-        self.SPI.xfer3(data)
+        spi_write_chunked(self.SPI, data, self.spi_chunk)
 
     def module_init(self):
         if self.Flag == 0:
@@ -250,8 +523,8 @@ class SunriseX3:
 
             self.GPIO.output(self.PWR_PIN, 1)
 
-            # SPI device, bus = 0, device = 0
-            self.SPI.open(2, 0)
+            # SPI device, bus = 2, device = 0 unless overridden
+            self.SPI.open(self.spi_bus, self.spi_device)
             self.SPI.max_speed_hz = 4000000
             self.SPI.mode = 0b00
             return 0
@@ -280,7 +553,10 @@ if sys.version_info[0] == 2:
     output = output.decode(sys.stdout.encoding)
 
 if "Raspberry" in output:
-    implementation = RaspberryPi()
+    if os.environ.get('EPD_GPIO_BACKEND') == 'gpiod':
+        implementation = RaspberryPiGpiod()
+    else:
+        implementation = RaspberryPi()
 elif os.path.exists('/sys/bus/platform/drivers/gpio-x3'):
     implementation = SunriseX3()
 else:
@@ -288,3 +564,19 @@ else:
 
 for func in [x for x in dir(implementation) if not x.startswith('_')]:
     setattr(sys.modules[__name__], func, getattr(implementation, func))
+
+
+def create(pins=None, spi_bus=None, spi_device=None):
+    '''
+    Returns a board implementation for one panel.
+    The module-level implementation is reused when nothing is overridden,
+    since its pins are already claimed at import time.
+    '''
+    if not pins and spi_bus is None and spi_device is None:
+        return implementation
+    kwargs = {'pins': pins}
+    if spi_bus is not None:
+        kwargs['spi_bus'] = spi_bus
+    if spi_device is not None:
+        kwargs['spi_device'] = spi_device
+    return type(implementation)(**kwargs)
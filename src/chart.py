@@ -0,0 +1,80 @@
+import numpy as np
+
+
+def to_array(values):
+    """Converts a series that may contain None into a float array with NaN gaps."""
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+
+def minmax_downsample(values, columns):
+    """Reduces a series to per-column min and max values.
+
+    Each output column covers a contiguous slice of the input. With fewer
+    points than columns, neighbouring columns repeat the same point.
+    """
+    n = len(values)
+    starts = (np.arange(columns) * n) // columns
+    # reduceat returns values[start] when a slice is empty, which is what
+    # upsampling needs; fmin/fmax skip NaN gaps
+    mins = np.fmin.reduceat(values, starts)
+    maxs = np.fmax.reduceat(values, starts)
+    return mins, maxs
+
+
+def scale_rows(values, vmin, vmax, height):
+    """Maps values to pixel rows, with vmax at row 0 and vmin at the bottom."""
+    span = vmax - vmin if vmax > vmin else 1.0
+    return np.rint((height - 1) * (vmax - values) / span)
+
+
+def rasterize_line(mins, maxs, height, vmin, vmax):
+    """Rasterizes a min/max envelope into a (height, columns) boolean mask.
+
+    Every column is filled between its min and max row, widened to meet
+    the neighbouring column, so the trace stays connected.
+    """
+    top = scale_rows(maxs, vmin, vmax, height)
+    bottom = scale_rows(mins, vmin, vmax, height)
+    # Join with the previous column: extend each span to cover its neighbour
+    prev_top = np.concatenate((top[:1], top[:-1]))
+    prev_bottom = np.concatenate((bottom[:1], bottom[:-1]))
+    top = np.fmin(top, prev_bottom)
+    bottom = np.fmax(bottom, prev_top)
+
+    rows = np.arange(height)[:, None]
+    # NaN comparisons are False, so gaps stay blank
+    return (rows >= top) & (rows <= bottom)
+
+
+def rasterize_bars(values, height, vmax):
+    """Rasterizes values as bars rising from the bottom edge."""
+    if vmax <= 0:
+        return np.zeros((height, len(values)), dtype=bool)
+    bar_heights = np.rint(np.clip(np.nan_to_num(values) / vmax, 0, 1) * height)
+    rows = np.arange(height)[:, None]
+    return rows >= (height - bar_heights)
+
+
+def render_hourly_chart(temperatures, precipitation, width, height):
+    """Renders temperature as a line over dithered precipitation bars.
+
+    Returns the 1-bit chart mask (True = black) and the plotted temperature
+    range, or None when there is no temperature to plot.
+    """
+    temps = to_array(temperatures)
+    if temps.size == 0 or np.all(np.isnan(temps)):
+        return None
+    t_min, t_max = minmax_downsample(temps, width)
+    vmin, vmax = np.nanmin(t_min), np.nanmax(t_max)
+    mask = rasterize_line(t_min, t_max, height, vmin, vmax)
+
+    if precipitation:
+        precip = to_array(precipitation)
+        _, p_max = minmax_downsample(precip, width)
+        # Bars use at most half the height; a light checker keeps them
+        # distinguishable from the temperature trace
+        bars = rasterize_bars(p_max, height // 2, max(np.nanmax(p_max), 1.0))
+        checker = (np.add.outer(np.arange(height // 2), np.arange(width)) % 2) == 0
+        mask[height - height // 2:] |= bars & checker
+
+    return mask, (float(vmin), float(vmax))
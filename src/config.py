@@ -0,0 +1,173 @@
+import os
+import json
+import ctypes
+import struct
+import logging
+
+try:
+    from src.locations import Location, load_locations, location_from_row
+except ImportError:
+    from locations import Location, load_locations, location_from_row
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCATIONS = [
+    Location("Birmingham, AL", 33.5186, -86.8104),
+    #Location("Calicut, Kerala", 11.2588, 75.7804),
+]
+
+
+class Config:
+    """Runtime settings that can change without restarting the daemon.
+
+    Example config.toml:
+
+        update_interval = 3600
+        night_interval = 10800             # optional, slower updates overnight
+        carousel_dwell = 20                # optional, rotate locations every 20 s
+        layout = "hourly"
+        show_clock = true
+        wind_speed_unit = "mph"
+        locations_file = "locations.csv"   # or [[locations]] tables
+
+        [fonts]
+        bold = "DejaVuSans-Bold.ttf"
+        regular = "DejaVuSans.ttf"
+
+        [[providers]]                      # optional, in order of preference
+        url = "http://weather.lan:8080/v1/forecast"
+    """
+
+    def __init__(self, locations=None, update_interval=60 * 60, layout="daily", show_clock=True,
+                 wind_speed_unit="kmh", fonts=None, locations_file=None, night_interval=None, providers=None,
+                 carousel_dwell=None):
+        self.locations = locations if locations is not None else list(DEFAULT_LOCATIONS)
+        self.update_interval = update_interval
+        # Seconds between updates while it is dark at the location; None keeps update_interval
+        self.night_interval = night_interval
+        self.layout = layout
+        self.show_clock = show_clock
+        self.wind_speed_unit = wind_speed_unit
+        self.fonts = fonts
+        # Large location lists come from a file; their sites share fetches per grid cell
+        self.locations_file = locations_file
+        # Seconds each location stays on screen; set with several locations to rotate
+        # pre-rendered frames independently of the fetches
+        self.carousel_dwell = carousel_dwell
+        # Weather provider entries for create_providers; None uses the public Open-Meteo API
+        self.providers = providers
+
+    def location_key(self):
+        return [(l.name, l.lat, l.lon, l.priority) for l in self.locations]
+
+
+def load_config(path):
+    """Reads a TOML or JSON config file; missing keys keep their defaults."""
+    if path.endswith(".toml"):
+        import tomllib
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    else:
+        with open(path, "r") as f:
+            data = json.load(f)
+
+    locations_file = data.get("locations_file")
+    if locations_file:
+        # Relative to the config file
+        locations_file = os.path.join(os.path.dirname(os.path.abspath(path)), locations_file)
+        locations = load_locations(locations_file)
+    elif "locations" in data:
+        if not isinstance(data["locations"], list):
+            raise ValueError("locations must be a list of tables")
+        locations = [location_from_row(l) for l in data["locations"]]
+    else:
+        locations = None
+    if locations is not None and not locations:
+        raise ValueError("No locations configured")
+
+    defaults = Config()
+    return Config(
+        locations=locations,
+        update_interval=data.get("update_interval", defaults.update_interval),
+        night_interval=data.get("night_interval"),
+        layout=data.get("layout", defaults.layout),
+        show_clock=data.get("show_clock", defaults.show_clock),
+        wind_speed_unit=data.get("wind_speed_unit", defaults.wind_speed_unit),
+        fonts=data.get("fonts"),
+        locations_file=locations_file,
+        providers=data.get("providers"),
+        carousel_dwell=data.get("carousel_dwell"),
+    )
+
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class ConfigWatcher:
+    """Watches a config file with inotify.
+
+    The directory is watched rather than the file, because editors and
+    deploy tools usually replace files by renaming over them. Without inotify
+    (non-Linux), changed() falls back to comparing mtimes.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.name = os.path.basename(self.path).encode()
+        self.fd = None
+        self.mtime = self._mtime()
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+            if libc.inotify_add_watch(fd, os.path.dirname(self.path).encode(), mask) < 0:
+                os.close(fd)
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+            self.fd = fd
+        except (OSError, AttributeError) as e:
+            logger.info(f"inotify unavailable ({e}); polling {self.path} instead")
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def fileno(self):
+        return self.fd
+
+    def changed(self):
+        """Drains pending events and returns True if the config file changed."""
+        if self.fd is None:
+            mtime = self._mtime()
+            changed, self.mtime = mtime != self.mtime, mtime
+            return changed
+
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                _, _, _, name_len = INOTIFY_EVENT.unpack_from(data, offset)
+                start = offset + INOTIFY_EVENT.size
+                name = data[start:start + name_len].rstrip(b"\0")
+                if name == self.name:
+                    changed = True
+                offset = start + name_len
+        return changed
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
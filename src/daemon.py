@@ -0,0 +1,445 @@
+import asyncio
+import signal
+import time
+import logging
+
+try:
+    from src.config import ConfigWatcher, load_config
+    from src.locations import GRID_CELL_SIZE
+    from src.profiling import CycleProfiler
+    from src.supervisor import Stage, StageFailed
+    from src import solar
+except ImportError:
+    from config import ConfigWatcher, load_config
+    from locations import GRID_CELL_SIZE
+    from profiling import CycleProfiler
+    from supervisor import Stage, StageFailed
+    import solar
+
+logger = logging.getLogger(__name__)
+
+# Shorter retry so a daemon started before the network is up recovers quickly
+RETRY_INTERVAL = 60
+CLOCK_INTERVAL = 60
+# Editors write config files in several steps; wait for them to settle
+CONFIG_SETTLE_DELAY = 0.5
+# Used when inotify is unavailable
+CONFIG_POLL_INTERVAL = 5
+# Attempts beyond the first before a stage gives up until the next cycle
+FETCH_RETRIES = 2
+PANEL_RETRIES = 2
+# Seconds between checks for changed overlay layers
+OVERLAY_POLL_INTERVAL = 1
+# Longest wait between day/night checks, e.g. after the shown location changes
+DAYLIGHT_CHECK_INTERVAL = 60 * 60
+# Check just after sunrise/sunset so the sun has crossed the horizon
+DAYLIGHT_MARGIN = 30
+# Pause before restarting a task that raised, so a persistent error cannot spin
+TASK_RESTART_DELAY = 10
+
+
+async def sleep_or_stop(stop_event, seconds, wake_event=None):
+    """Sleeps for `seconds` unless stop_event (or wake_event) is set first. Returns True if stopping."""
+    waiters = [asyncio.ensure_future(stop_event.wait())]
+    if wake_event is not None:
+        waiters.append(asyncio.ensure_future(wake_event.wait()))
+    _, pending = await asyncio.wait(waiters, timeout=seconds, return_when=asyncio.FIRST_COMPLETED)
+    for waiter in pending:
+        waiter.cancel()
+    return stop_event.is_set()
+
+
+class WeatherDaemon:
+    """Event-driven main loop with independent timers.
+
+    The weather refresh, the clock tick and the day/night icon switch run as
+    separate tasks. Blocking
+    work (HTTP, rendering, SPI and BUSY waits) runs in worker threads, and a
+    lock serializes panel access so a clock tick never interleaves with a
+    full refresh.
+
+    With a config_path, the file is watched and changes are applied in place:
+    services, caches and the panel driver are kept, only what changed is redone.
+
+    Fetch, render and panel work run as supervised stages. A failure in one
+    is retried a bounded number of times and then skipped until the next
+    cycle; the panel keeps its last good frame and the driver is
+    re-initialized only when the panel itself faulted. A task that raises
+    outside a stage is logged and restarted.
+
+    With a compositor, overlay layers written by other processes are drawn
+    over the frame; the daemon stays the only user of the driver.
+
+    With carousel_dwell set and several locations, fetches only refresh a
+    pre-rendered frame per location, and a separate task rotates those
+    frames on screen every carousel_dwell seconds with partial refreshes.
+
+    SIGUSR1 profiles the next few weather cycles (see CycleProfiler).
+    """
+
+    def __init__(self, display_service, weather_service, config, history=None, config_path=None, profiler=None,
+                 compositor=None):
+        self.display_service = display_service
+        self.weather_service = weather_service
+        self.config = config
+        # Optional HistoryArchive that keeps every fetched `current` block
+        self.history = history
+        self.config_path = config_path
+        self.profiler = profiler or CycleProfiler()
+        # Optional framebuffer.Compositor
+        self.compositor = compositor
+        display_service.compositor = compositor
+        self.fetch_stage = Stage("fetch", retries=FETCH_RETRIES, backoff=5)
+        self.history_stage = Stage("history")
+        # The same payload would fail the same way; no point retrying a render
+        self.render_stage = Stage("render")
+        self.panel_stage = Stage("panel", retries=PANEL_RETRIES, on_fault=display_service.reinit_panel)
+        self.location_index = 0
+        # Monotonic deadlines of the next weather fetch and of the last good one
+        self.next_fetch = 0
+        self.last_fetch = None
+        self.last_weather = None
+        self.last_location_name = None
+        # Carousel frames by location name
+        self.frames = {}
+        self.stop_event = None
+        self.wake_event = None
+        self.panel_lock = None
+        self.carousel_event = None
+        # Worker threads that touch the panel, history or compositor
+        self.workers = set()
+
+    @property
+    def locations(self):
+        return self.config.locations
+
+    def run(self):
+        asyncio.run(self.run_async())
+
+    async def run_async(self):
+        self.stop_event = asyncio.Event()
+        self.wake_event = asyncio.Event()
+        self.carousel_event = asyncio.Event()
+        self.panel_lock = asyncio.Lock()
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stop_event.set)
+        loop.add_signal_handler(signal.SIGUSR1, self.profiler.arm)
+
+        loops = {
+            "weather": self.weather_loop,
+            # Idles cheaply when the clock is off, and picks up config changes
+            "clock": self.clock_loop,
+            "daylight": self.daylight_loop,
+            # Idles until carousel mode is configured
+            "carousel": self.carousel_loop,
+        }
+        if self.config_path:
+            loops["config"] = self.config_loop
+        if self.compositor is not None:
+            loops["overlays"] = self.overlay_loop
+        tasks = [asyncio.create_task(self.supervise(name, loop), name=name) for name, loop in loops.items()]
+
+        await self.stop_event.wait()
+        logger.info("Exiting...")
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # A cancelled task has let go of the panel lock, but its worker may still be mid-transfer
+        if self.workers:
+            logger.info("Waiting for panel work in progress...")
+            await asyncio.wait(self.workers)
+
+        # Leave the last frame on screen; it is restored from cache on next start
+        async with self.panel_lock:
+            try:
+                await asyncio.to_thread(self.display_service.sleep)
+            except Exception as e:
+                logger.error(f"Could not put the panel to sleep: {e}")
+        if self.history is not None:
+            self.history.close()
+        if self.compositor is not None:
+            self.compositor.close()
+
+    async def supervise(self, name, loop):
+        """Runs loop() until it returns, restarting it if it raises."""
+        while True:
+            try:
+                return await loop()
+            except Exception as e:
+                logger.error(f"{name} task failed, restarting in {TASK_RESTART_DELAY} s: {e}", exc_info=True)
+            if await sleep_or_stop(self.stop_event, TASK_RESTART_DELAY):
+                return
+
+    async def weather_loop(self):
+        while True:
+            delay = self.next_fetch - time.monotonic()
+            if delay > 0:
+                self.wake_event.clear()
+                if await sleep_or_stop(self.stop_event, delay, self.wake_event):
+                    return
+                # Woken early by a config change: recompute the deadline
+                continue
+
+            if not self.locations:
+                logger.error("No locations configured")
+                self.next_fetch = time.monotonic() + RETRY_INTERVAL
+                continue
+            self.location_index %= len(self.locations)
+            location = self.locations[self.location_index]
+            logger.info(f"Fetching weather data for {location.name}...")
+            profiler = self.profiler
+            stale = False
+            try:
+                # Errors raise so the stage can retry them; the stale fallback comes after
+                weather = await asyncio.to_thread(profiler.call, "fetch", self.fetch_stage.run,
+                                                  self.weather_service.get_current_weather,
+                                                  lat=location.lat, lon=location.lon, priority=location.priority,
+                                                  fallback=False)
+            except StageFailed:
+                weather = self.weather_service.stale_weather(location.lat, location.lon)
+                stale = True
+
+            if weather:
+                logger.info(f"Weather fetched: {weather}")
+                # A stale forecast was recorded when it was fetched
+                if self.history is not None and not stale:
+                    try:
+                        await self.in_worker(profiler.call, "history", self.history_stage.run,
+                                             self.history.record, location.name, weather['current'])
+                    except StageFailed:
+                        pass
+                if self.carousel_enabled():
+                    frame = self.frames.get(location.name)
+                    # An unchanged forecast keeps its packed frame
+                    shown = (frame is not None and frame.weather == weather
+                             or await self.prerender(weather, location.name) is not None)
+                else:
+                    logger.info("Updating display...")
+                    shown = await self.show(weather, location.name)
+                if shown:
+                    self.last_weather = weather
+                    self.last_location_name = location.name
+                    self.last_fetch = time.monotonic()
+                    # Cycle to next location
+                    self.location_index = (self.location_index + 1) % len(self.locations)
+                    wait = self.refresh_interval()
+                    if self.carousel_enabled():
+                        # Spread fetches over the interval, but fill in missing frames straight away
+                        missing = any(l.name not in self.frames for l in self.locations)
+                        wait = 0 if missing else wait / len(self.locations)
+                else:
+                    logger.error("Display update failed; keeping the last frame")
+                    wait = RETRY_INTERVAL
+            else:
+                logger.error("Failed to fetch weather data")
+                wait = RETRY_INTERVAL
+
+            if profiler.active:
+                await asyncio.to_thread(profiler.end_cycle)
+            logger.info(f"Next weather update in {wait} seconds")
+            self.next_fetch = time.monotonic() + wait
+
+    async def in_worker(self, func, *args, **kwargs):
+        """Runs func in a worker thread that outlives cancellation of the caller.
+
+        A thread cannot be stopped mid-transfer, so shutdown waits for it
+        before the panel is put to sleep and the history and layers are closed.
+        """
+        worker = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+        self.workers.add(worker)
+        worker.add_done_callback(self.workers.discard)
+        return await asyncio.shield(worker)
+
+    async def show(self, weather, location_name):
+        """Renders and pushes a frame. Returns False if a stage failed; the panel keeps its last frame."""
+        profiler = self.profiler
+        async with self.panel_lock:
+            if self.display_service.shows_forecast(weather, location_name):
+                # e.g. the first fetch after a restart returns the forecast of the restored frame
+                logger.info("Panel already shows this forecast, skipping render")
+                self.display_service.shown_weather = weather
+                return True
+            try:
+                buffer = await self.in_worker(profiler.call, "render", self.render_stage.run,
+                                              self.display_service.render, weather, location_name)
+                if buffer is None:
+                    return False
+                await self.in_worker(profiler.call, "panel", self.panel_stage.run,
+                                     self.display_service.show_buffer, buffer, weather, location_name)
+            except StageFailed:
+                return False
+        return True
+
+    async def update_panel(self, func, *args):
+        # Small panel updates (clock, day/night icon, carousel step); a failure waits for the next tick
+        async with self.panel_lock:
+            try:
+                await self.in_worker(self.panel_stage.run, func, *args)
+            except StageFailed:
+                pass
+
+    def carousel_enabled(self):
+        return bool(self.config.carousel_dwell) and len(self.locations) > 1
+
+    async def prerender(self, weather, location_name):
+        """Renders a location's carousel frame off screen. Returns None if rendering failed."""
+        try:
+            frame = await self.in_worker(self.profiler.call, "render", self.render_stage.run,
+                                         self.display_service.prerender, weather, location_name)
+        except StageFailed:
+            return None
+        if frame is not None:
+            self.frames[location_name] = frame
+        return frame
+
+    async def carousel_loop(self):
+        """Rotates the pre-rendered location frames, independently of the fetches."""
+        position = -1
+        while True:
+            self.carousel_event.clear()
+            dwell = self.config.carousel_dwell if self.carousel_enabled() else None
+            if await sleep_or_stop(self.stop_event, dwell, self.carousel_event):
+                return
+            if self.carousel_event.is_set() or not self.carousel_enabled():
+                # Reconfigured: start a fresh dwell
+                continue
+
+            frames = [self.frames[l.name] for l in self.locations if l.name in self.frames]
+            if not frames:
+                continue
+            position = (position + 1) % len(frames)
+            frame = frames[position]
+            if frame.is_day != self.display_service.is_day(frame.weather):
+                # Sunrise or sunset since it was drawn
+                frame = await self.prerender(frame.weather, frame.location_name) or frame
+            await self.update_panel(self.display_service.show_frame, frame)
+
+    def refresh_interval(self, now=None):
+        """Seconds until the next fetch, longer while it is dark at the next location.
+
+        Night waits end at sunrise, so the morning forecast is fetched on time.
+        """
+        interval = self.config.update_interval
+        night_interval = self.config.night_interval
+        if not night_interval or night_interval <= interval:
+            return interval
+        now = time.time() if now is None else now
+        location = self.locations[self.location_index % len(self.locations)]
+        if solar.is_day(location.lat, location.lon, now):
+            return interval
+        sunrise = solar.next_transition(location.lat, location.lon, now)
+        if sunrise is None:
+            # Polar night
+            return night_interval
+        return max(interval, min(night_interval, sunrise - now))
+
+    async def daylight_loop(self):
+        """Switches the shown icon between day and night at sunrise and sunset, without a fetch."""
+        while True:
+            wait = DAYLIGHT_CHECK_INTERVAL
+            weather = self.display_service.shown_weather
+            if weather and weather.get('latitude') is not None:
+                transition = solar.next_transition(weather['latitude'], weather['longitude'])
+                if transition is not None:
+                    wait = min(wait, transition - time.time() + DAYLIGHT_MARGIN)
+            if await sleep_or_stop(self.stop_event, wait):
+                return
+            await self.update_panel(self.display_service.update_daylight)
+
+    async def overlay_loop(self):
+        """Pushes overlay layer changes with one partial refresh per poll."""
+        while True:
+            if await sleep_or_stop(self.stop_event, OVERLAY_POLL_INTERVAL):
+                return
+            # Reads only the layer headers; cheap enough to do in the event loop.
+            # The lock keeps it from closing layers a worker thread is composing.
+            async with self.panel_lock:
+                changed = self.compositor.changed()
+            if changed:
+                await self.update_panel(self.display_service.update_overlays)
+
+    async def clock_loop(self):
+        while True:
+            # Wake just after each minute boundary
+            if await sleep_or_stop(self.stop_event, CLOCK_INTERVAL - time.time() % CLOCK_INTERVAL + 0.05):
+                return
+            await self.update_panel(self.display_service.update_clock)
+
+    async def config_loop(self):
+        watcher = ConfigWatcher(self.config_path)
+        changed = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        if watcher.fileno() is not None:
+            loop.add_reader(watcher.fileno(), changed.set)
+        try:
+            while True:
+                timeout = None if watcher.fileno() is not None else CONFIG_POLL_INTERVAL
+                if await sleep_or_stop(self.stop_event, timeout, changed):
+                    return
+                changed.clear()
+                if watcher.fileno() is not None:
+                    await sleep_or_stop(self.stop_event, CONFIG_SETTLE_DELAY)
+                if not watcher.changed():
+                    continue
+
+                try:
+                    config = await asyncio.to_thread(load_config, self.config_path)
+                except Exception as e:
+                    # Keep running on the old config until the file is fixed
+                    logger.error(f"Ignoring invalid config {self.config_path}: {e}")
+                    continue
+                logger.info(f"Reloaded {self.config_path}")
+                await self.apply_config(config)
+        finally:
+            if watcher.fileno() is not None:
+                loop.remove_reader(watcher.fileno())
+            watcher.close()
+
+    async def apply_config(self, config):
+        was_carousel = self.carousel_enabled()
+        old, self.config = self.config, config
+        refetch = False
+
+        grid_cell_size = GRID_CELL_SIZE if config.locations_file else None
+        if config.wind_speed_unit != old.wind_speed_unit or grid_cell_size != self.weather_service.grid_cell_size:
+            # Cached forecasts are in the old unit or keyed by the old grid
+            self.weather_service.wind_speed_unit = config.wind_speed_unit
+            self.weather_service.grid_cell_size = grid_cell_size
+            self.weather_service.clear_cache()
+            refetch = True
+        if config.providers != old.providers:
+            self.weather_service.configure_providers(config.providers)
+        if config.location_key() != old.location_key():
+            self.location_index = 0
+            refetch = True
+
+        if refetch:
+            # Frames were drawn for the old locations or units
+            self.frames.clear()
+        if self.carousel_enabled() != was_carousel or config.carousel_dwell != old.carousel_dwell:
+            self.carousel_event.set()
+            if not was_carousel:
+                refetch = True
+
+        if refetch:
+            self.next_fetch = 0
+        elif ((config.update_interval, config.night_interval) != (old.update_interval, old.night_interval)
+              and self.last_fetch is not None):
+            self.next_fetch = self.last_fetch + self.refresh_interval()
+        self.wake_event.set()
+
+        relayout = self.display_service.configure(
+            layout=config.layout,
+            show_clock=config.show_clock,
+            fonts=config.fonts,
+            wind_speed_unit=config.wind_speed_unit,
+        )
+        if relayout and not refetch:
+            if self.carousel_enabled():
+                # Redraw every frame from the forecast it already has
+                for frame in list(self.frames.values()):
+                    await self.prerender(frame.weather, frame.location_name)
+            elif self.last_weather is not None:
+                await self.show(self.last_weather, self.last_location_name)
@@ -1,74 +1,268 @@
 import os
 import sys
 import logging
-from PIL import Image, ImageDraw, ImageFont
+import bisect
+import traceback
 from datetime import datetime
 
 # Ensure lib is in path if running directly (for testing)
 if __name__ == "__main__":
     sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib'))
 
+class HeadlessEPD:
+    """Stands in for the driver where there is no panel: on non-Pi systems,
+    when the driver fails to init, or when rendering frames for others."""
+    width = 122
+    height = 250
+    def init(self): pass
+    def Clear(self, color): pass
+    def display(self, image): pass
+    def displayPartBaseImage(self, image): pass
+    def displayPartialWindow(self, image, x_start, y_start, x_end, y_end): pass
+    def SetBaseImage(self, image): pass
+    def getbuffer(self, image):
+        # Same packing as the real driver, so frames can be rendered headless
+        if image.size == (self.height, self.width):
+            image = image.rotate(90, expand=True)
+        return bytearray(image.convert('1').tobytes('raw'))
+    def sleep(self): pass
+
 try:
     from waveshare_epd import epd2in13_V4
+    EPD_AVAILABLE = True
 except (ImportError, RuntimeError, Exception) as e:
+    EPD_AVAILABLE = False
     # Mock for testing on non-Pi systems or if driver fails to init
     print(f"Warning: waveshare_epd driver could not be loaded ({e}). Using mock.")
-    class MockEPD:
-        width = 122
-        height = 250
-        def init(self): pass
-        def Clear(self, color): pass
-        def display(self, image): pass
-        def getbuffer(self, image): return []
-        def sleep(self): pass
-    
     class MockModule:
-        EPD = MockEPD
+        EPD = HeadlessEPD
     
     epd2in13_V4 = MockModule()
 
+def create_epd(pins=None, spi_bus=None, spi_device=None):
+    """Creates an EPD driver for one panel.
+
+    pins maps epdconfig pin names (RST_PIN, DC_PIN, ...) to BCM numbers;
+    anything left out uses the board defaults.
+    """
+    if not EPD_AVAILABLE:
+        return epd2in13_V4.EPD()
+    from waveshare_epd import epdconfig
+    return epd2in13_V4.EPD(config=epdconfig.create(pins, spi_bus, spi_device))
+
+def is_panel_fault(error):
+    """True if the exception was raised inside the panel driver, rather than by rendering or data."""
+    return any("waveshare_epd" in frame.filename for frame in traceback.extract_tb(error.__traceback__))
+
 try:
-    from src.icons import IconDrawer
+    from src.frame_cache import FrameCache
+    from src import solar
 except ImportError:
-    from icons import IconDrawer
+    from frame_cache import FrameCache
+    import solar
+
+logger = logging.getLogger(__name__)
+
+HOURLY_CHART_HOURS = 24
+# Landscape box (x0, y0, x1, y1) of the clock in the top-right corner
+CLOCK_BOX = (200, 0, 250, 11)
+# Landscape box of the current-conditions icon, redrawn when day turns to night
+ICON_BOX = (5, 5, 55, 55)
+# Partial refreshes ghost; force a full refresh after this many in a row
+MAX_PARTIAL_REFRESHES = 60
+# Open-Meteo wind_speed_unit values and how they are shown
+WIND_SPEED_LABELS = {"kmh": "km/h", "ms": "m/s", "mph": "mph", "kn": "kn"}
+
+class Frame:
+    """A rendered frame kept ready to push: landscape image (without the clock) and packed buffer."""
+    __slots__ = ("image", "buffer", "weather", "location_name", "is_day")
+
+    def __init__(self, image, buffer, weather, location_name, is_day):
+        self.image = image
+        self.buffer = buffer
+        self.weather = weather
+        self.location_name = location_name
+        self.is_day = is_day
 
 class DisplayService:
-    def __init__(self):
-        self.epd = epd2in13_V4.EPD()
+    def __init__(self, epd=None, frame_cache=None, layout="daily", show_clock=False):
+        self.epd = epd if epd is not None else epd2in13_V4.EPD()
+        # "daily": three forecast columns, "hourly": temperature/precipitation chart
+        self.layout = layout
+        self.show_clock = show_clock
+        # Optional {"bold": path, "regular": path} tried before the system fonts
+        self.font_files = None
+        self.wind_speed_unit = "kmh"
         self.epd.init()
-        self.epd.Clear(0xFF)
+        self.frame_cache = frame_cache if frame_cache is not None else FrameCache()
+        self.fonts_loaded = False
+        self.last_buffer = None
+        # Last composed frame in landscape orientation, redrawn in place by widgets
+        self.base_image = None
+        # Whether the controller RAM holds last_buffer as the partial-refresh reference
+        self.partial_base_ready = False
+        self.partial_count = 0
+        # Forecast and layout settings behind the cached frame, so callers can skip a redundant redraw
+        self.cached_weather = None
+        self.cached_location_name = None
+        self.cached_settings = None
+        self.cached_etag = None
+        # Forecast behind the frame on the panel, and whether its icon shows day
+        self.shown_weather = None
+        self.shown_is_day = None
+        # Optional framebuffer.Compositor whose overlay layers are drawn over every frame
+        self.compositor = None
+        # Whether the panel shows the frame in frame_cache, so a restart can leave it alone
+        self.cache_on_panel = False
+        self.restore_cached_frame()
+
+    def restore_cached_frame(self):
+        """Puts the last persisted frame on the panel without PIL or network.
+
+        Falls back to a blank full refresh only when nothing was cached.
+        """
+        cached = self.frame_cache.load()
+        if cached is None:
+            self.epd.Clear(0xFF)
+            return
+
+        self.cache_on_panel = True
+        if cached.on_panel:
+            logger.info("Panel already shows the cached frame, leaving it untouched")
+        else:
+            logger.info("Showing cached frame")
+            self.epd.display(cached.buffer)
+            self.frame_cache.mark_on_panel(True)
+        self.partial_base_ready = False
+
+        self.last_buffer = bytes(cached.buffer)
+        self.cached_weather = cached.weather
+        self.shown_weather = cached.weather
+        self.cached_location_name = cached.location_name
+        self.cached_settings = cached.settings
+        self.cached_etag = cached.etag
+
+    def load_fonts(self):
+        """Loads fonts on first render; deferred so a cached frame can be shown first."""
+        if self.fonts_loaded:
+            return
+        from PIL import ImageFont
+
         # Use default font for simplicity
         self.font = ImageFont.load_default()
-        # Try to load fonts (Linux/Pi usually has DejaVuSans, Windows has Arial)
-        try:
-            # Bold fonts for headers/main info
-            self.font_location = ImageFont.truetype("DejaVuSans-Bold.ttf", 24)
-            self.font_temp = ImageFont.truetype("DejaVuSans-Bold.ttf", 36)
-            self.font_detail = ImageFont.truetype("DejaVuSans.ttf", 18)
-            self.font_forecast = ImageFont.truetype("DejaVuSans-Bold.ttf", 22)
-        except IOError:
+        # Try to load fonts (Linux/Pi usually has DejaVuSans, Windows has Arial),
+        # starting with any configured in the config file
+        candidates = [("DejaVuSans-Bold.ttf", "DejaVuSans.ttf"), ("arialbd.ttf", "arial.ttf")]
+        if self.font_files:
+            candidates.insert(0, (self.font_files.get("bold", "DejaVuSans-Bold.ttf"),
+                                  self.font_files.get("regular", "DejaVuSans.ttf")))
+        for bold, regular in candidates:
             try:
-                # Fallback for Windows
-                self.font_location = ImageFont.truetype("arialbd.ttf", 24)
-                self.font_temp = ImageFont.truetype("arialbd.ttf", 36)
-                self.font_detail = ImageFont.truetype("arial.ttf", 18)
-                self.font_forecast = ImageFont.truetype("arialbd.ttf", 22)
+                # Bold fonts for headers/main info
+                self.font_location = ImageFont.truetype(bold, 24)
+                self.font_temp = ImageFont.truetype(bold, 36)
+                self.font_detail = ImageFont.truetype(regular, 18)
+                self.font_forecast = ImageFont.truetype(bold, 22)
+                break
             except IOError:
-                # Ultimate fallback
-                self.font_location = ImageFont.load_default()
-                self.font_temp = ImageFont.load_default()
-                self.font_detail = ImageFont.load_default()
-                self.font_forecast = ImageFont.load_default()
+                continue
+        else:
+            # Ultimate fallback
+            self.font_location = ImageFont.load_default()
+            self.font_temp = ImageFont.load_default()
+            self.font_detail = ImageFont.load_default()
+            self.font_forecast = ImageFont.load_default()
+        self.fonts_loaded = True
+
+    def configure(self, layout=None, show_clock=None, fonts=None, wind_speed_unit=None):
+        """Applies layout settings in place; the driver and panel state are untouched.
+
+        Returns True if the current frame needs to be re-rendered.
+        """
+        changed = False
+        if layout is not None and layout != self.layout:
+            self.layout = layout
+            changed = True
+        if show_clock is not None and show_clock != self.show_clock:
+            self.show_clock = show_clock
+            changed = True
+        if fonts != self.font_files:
+            self.font_files = fonts
+            self.fonts_loaded = False
+            changed = True
+        if wind_speed_unit is not None and wind_speed_unit != self.wind_speed_unit:
+            self.wind_speed_unit = wind_speed_unit
+            changed = True
+        return changed
+
+    def render_settings(self):
+        """Settings that change how a forecast is drawn, stored with the cached frame."""
+        return {
+            "layout": self.layout,
+            "show_clock": self.show_clock,
+            "fonts": self.font_files,
+            "wind_speed_unit": self.wind_speed_unit,
+        }
+
+    def shows_forecast(self, weather_data, location_name):
+        """True if the panel still shows the cached frame, drawn from this forecast with the current settings.
+
+        Rendering it again would only redraw the same frame; the clock and the
+        day/night icon are kept current by their own partial updates.
+        """
+        return (self.cache_on_panel and weather_data is not None
+                and self.cached_weather == weather_data
+                and self.cached_location_name == location_name
+                and self.cached_settings == self.render_settings())
 
     def update_display(self, weather_data, location_name="Weather"):
+        buffer = self.render(weather_data, location_name)
+        if buffer is not None:
+            self.show_buffer(buffer, weather_data, location_name)
+
+    def render(self, weather_data, location_name="Weather"):
+        """Draws the layout and returns the packed panel buffer, or None if there is nothing to show."""
+        drawn = self.draw_frame(weather_data, location_name)
+        if drawn is None:
+            return None
+        image, is_day = drawn
+        if self.show_clock:
+            from PIL import ImageDraw
+            self.draw_clock(ImageDraw.Draw(image), datetime.now())
+        self.base_image = image
+        self.shown_weather = weather_data
+        self.shown_is_day = is_day
+
+        # Rotate image 180 degrees
+        image = self.composed(image).rotate(180)
+        
+        return self.epd.getbuffer(image)
+
+    def prerender(self, weather_data, location_name="Weather"):
+        """Draws a Frame to show later with show_frame(); the panel state is left alone."""
+        drawn = self.draw_frame(weather_data, location_name)
+        if drawn is None:
+            return None
+        image, is_day = drawn
+        return Frame(image, bytes(self.epd.getbuffer(image.rotate(180))), weather_data, location_name, is_day)
+
+    def draw_frame(self, weather_data, location_name="Weather"):
+        """Draws the layout without the clock. Returns (landscape image, is_day), or None."""
         if not weather_data:
-            return
+            return None
         
         current = weather_data.get('current', {})
         daily = weather_data.get('daily', {})
         
         if not current:
-            return
+            return None
+
+        from PIL import Image, ImageDraw
+        try:
+            from src.icons import IconDrawer
+        except ImportError:
+            from icons import IconDrawer
+        self.load_fonts()
 
         # EPD_WIDTH = 122, EPD_HEIGHT = 250
         # Landscape mode: 250x122
@@ -81,12 +275,10 @@ class DisplayService:
         
         # --- Current Weather (Top Half) ---
         # Icon
-        icon_size = 50
-        icon_x = 5
-        icon_y = 5
+        x0, y0, x1, _ = ICON_BOX
         code = current.get('weathercode')
-        is_day = current.get('is_day', 1)
-        icon_drawer.draw_icon_for_code(code, icon_x, icon_y, icon_size, is_day)
+        is_day = self.is_day(weather_data)
+        icon_drawer.draw_icon_for_code(code, x0, y0, x1 - x0, is_day)
         
         # Temp
         temp_c = current.get('temperature')
@@ -104,12 +296,196 @@ class DisplayService:
             ix = round(d / (360. / len(dirs)))
             return dirs[ix % len(dirs)]
         wind_cardinal = get_cardinal(wind_dir)
-        draw.text((65, 40), f"Wind: {wind} km/h {wind_cardinal}", font=self.font_detail, fill=0)
+        wind_label = WIND_SPEED_LABELS.get(self.wind_speed_unit, self.wind_speed_unit)
+        draw.text((65, 40), f"Wind: {wind} {wind_label} {wind_cardinal}", font=self.font_detail, fill=0)
 
         # Divider between top and bottom
         draw.line((0, 65, width, 65), fill=0, width=2)
         
         # --- Forecast (Bottom Half) ---
+        hourly = weather_data.get('hourly') or {}
+        if self.layout == "hourly" and any(t is not None for t in hourly.get('temperature_2m', [])):
+            self.draw_hourly_chart(image, hourly, current.get('time'), (0, 68, width, height))
+        else:
+            self.draw_daily_forecast(draw, icon_drawer, daily, width)
+
+        return image, is_day
+
+    def show_frame(self, frame):
+        """Shows a pre-rendered frame, partially refreshing only what differs from the panel.
+
+        Nothing is re-rendered; only the clock and overlays are drawn on top.
+        Without overlays, only the clock's strip is packed again and patched
+        into the frame's packed buffer. Returns True if the panel changed.
+        """
+        image = frame.image.copy()
+        buffer = frame.buffer
+        if self.show_clock:
+            from PIL import ImageDraw
+            self.load_fonts()
+            self.draw_clock(ImageDraw.Draw(image), datetime.now())
+        if self.compositor is not None:
+            buffer = bytes(self.epd.getbuffer(self.composed(image).rotate(180)))
+        elif self.show_clock:
+            buffer = self.patch_buffer(buffer, image, CLOCK_BOX[0], CLOCK_BOX[2])
+        self.base_image = image
+        self.shown_weather = frame.weather
+        self.shown_is_day = frame.is_day
+        if self.cache_on_panel:
+            # The cached frame is no longer on screen; a restart has to redraw it
+            self.frame_cache.mark_on_panel(False)
+            self.cache_on_panel = False
+            self.cached_weather = None
+        if self.last_buffer is None:
+            self.push_full(buffer)
+            return True
+        return self.push_changes(buffer)
+
+    def is_day(self, weather_data, timestamp=None):
+        """Day or night at the forecast location, worked out locally rather than taken from the fetch."""
+        lat, lon = weather_data.get('latitude'), weather_data.get('longitude')
+        if lat is None or lon is None:
+            # Forecasts cached before coordinates were kept
+            return bool(weather_data.get('current', {}).get('is_day', 1))
+        return solar.is_day(lat, lon, timestamp)
+
+    def show_buffer(self, buffer, weather_data=None, location_name=None, etag=None):
+        """Pushes a packed frame unless the panel already shows it. Returns True if pushed."""
+        if self.last_buffer is not None and bytes(buffer) == self.last_buffer:
+            logger.info("Frame unchanged, skipping panel refresh")
+            return False
+        self.push_full(buffer)
+        settings = self.render_settings()
+        self.frame_cache.save(buffer, weather_data, location_name, etag=etag, settings=settings)
+        self.cache_on_panel = True
+        self.cached_weather = weather_data
+        self.cached_location_name = location_name
+        self.cached_settings = settings
+        return True
+
+    def push_full(self, buffer):
+        # Full refresh that also loads the partial-refresh reference RAM
+        self.epd.displayPartBaseImage(buffer)
+        self.last_buffer = bytes(buffer)
+        self.partial_base_ready = True
+        self.partial_count = 0
+
+    def draw_clock(self, draw, now):
+        x0, y0, x1, y1 = CLOCK_BOX
+        draw.rectangle((x0, y0, x1 - 1, y1 - 1), fill=255)
+        text = now.strftime('%H:%M')
+        bbox = draw.textbbox((0, 0), text, font=self.font)
+        draw.text((x1 - (bbox[2] - bbox[0]) - 2, y0), text, font=self.font, fill=0)
+
+    def patch_buffer(self, buffer, image, x0, x1):
+        """Returns a copy of the packed buffer with the landscape columns x0..x1 repacked from image.
+
+        Each landscape column is one packed panel row, so only that strip is
+        rotated and packed rather than the whole frame.
+        """
+        stride = (self.epd.width + 7) // 8
+        # Same rotations as a full frame: 180 degrees, then into portrait
+        strip = image.crop((x0, 0, x1, image.height)).rotate(180).rotate(90, expand=True)
+        patched = bytearray(buffer)
+        patched[x0 * stride:x1 * stride] = strip.convert('1').tobytes('raw')
+        return bytes(patched)
+
+    def restore_base_image(self):
+        # Rebuild the landscape image from the packed buffer, e.g. after a restore
+        from PIL import Image
+        portrait = Image.frombytes('1', (self.epd.width, self.epd.height), bytes(self.last_buffer))
+        return portrait.rotate(-90, expand=True).rotate(180)
+
+    def update_clock(self, now=None):
+        """Redraws only the clock region and pushes it with a partial refresh."""
+        if not self.show_clock or self.last_buffer is None:
+            return
+        self.load_fonts()
+        from PIL import ImageDraw
+        if self.base_image is None:
+            self.base_image = self.restore_base_image()
+
+        self.draw_clock(ImageDraw.Draw(self.base_image), now or datetime.now())
+        self.push_changes()
+
+    def update_daylight(self, timestamp=None):
+        """Swaps the current-conditions icon between its day and night forms.
+
+        Only the icon is redrawn and pushed with a partial refresh; no fetch or
+        full render is needed. Returns True if the icon changed.
+        """
+        weather = self.shown_weather
+        if not weather or not weather.get('current') or self.last_buffer is None:
+            return False
+        is_day = self.is_day(weather, timestamp)
+        if is_day == self.shown_is_day:
+            return False
+        from PIL import ImageDraw
+        try:
+            from src.icons import IconDrawer
+        except ImportError:
+            from icons import IconDrawer
+        if self.base_image is None:
+            self.base_image = self.restore_base_image()
+
+        draw = ImageDraw.Draw(self.base_image)
+        x0, y0, x1, y1 = ICON_BOX
+        draw.rectangle((x0, y0, x1 - 1, y1 - 1), fill=255)
+        IconDrawer(draw).draw_icon_for_code(weather['current'].get('weathercode'), x0, y0, x1 - x0, is_day)
+        self.shown_is_day = is_day
+        logger.info(f"Switching to the {'day' if is_day else 'night'} icon")
+        self.push_changes()
+        return True
+
+    def composed(self, image):
+        return self.compositor.compose(image) if self.compositor is not None else image
+
+    def update_overlays(self):
+        """Re-composes the overlay layers over the frame and refreshes just the region that changed."""
+        if self.last_buffer is None:
+            return False
+        if self.base_image is None:
+            self.base_image = self.restore_base_image()
+        return self.push_changes()
+
+    def changed_window(self, buffer):
+        """Panel RAM window (x_start, y_start, x_end, y_end) around every byte that differs from last_buffer.
+
+        x is in whole bytes, as the controller requires. Returns None if nothing changed.
+        """
+        import numpy as np
+        stride = (self.epd.width + 7) // 8
+        diff = np.frombuffer(buffer, dtype=np.uint8) ^ np.frombuffer(self.last_buffer, dtype=np.uint8)
+        diff = diff.reshape(-1, stride)
+        rows = np.flatnonzero(diff.any(axis=1))
+        if not rows.size:
+            return None
+        cols = np.flatnonzero(diff.any(axis=0))
+        return int(cols[0]) * 8, int(rows[0]), min(int(cols[-1]) * 8 + 7, self.epd.width - 1), int(rows[-1])
+
+    def push_changes(self, buffer=None):
+        """Pushes base_image and its overlays (or a given packed buffer), partially refreshing only the region that changed.
+
+        Returns True if anything changed.
+        """
+        if buffer is None:
+            buffer = bytes(self.epd.getbuffer(self.composed(self.base_image).rotate(180)))
+        window = self.changed_window(buffer)
+        if window is None:
+            return False
+
+        if self.partial_count >= MAX_PARTIAL_REFRESHES:
+            self.push_full(buffer)
+            return True
+        if not self.partial_base_ready:
+            self.epd.SetBaseImage(self.last_buffer)
+            self.partial_base_ready = True
+        self.epd.displayPartialWindow(buffer, *window)
+        self.last_buffer = buffer
+        self.partial_count += 1
+        return True
+
+    def draw_daily_forecast(self, draw, icon_drawer, daily, width):
         # We have daily data: time, weathercode, temperature_2m_max, temperature_2m_min
         # We want to show today, tomorrow, day after (3 days)
         
@@ -149,14 +525,72 @@ class DisplayService:
             w = bbox[2] - bbox[0]
             draw.text((day_x + (col_width - w)//2, 125), temp_range, font=self.font_forecast, fill=0)
 
+    def draw_hourly_chart(self, image, hourly, current_time, box, hours=HOURLY_CHART_HOURS):
+        """Plots the next `hours` of hourly temperature and precipitation into box.
 
-        # Rotate image 180 degrees
-        image = image.rotate(180)
-        
-        self.epd.display(self.epd.getbuffer(image))
+        Downsampling, scaling and rasterization are done on whole NumPy arrays,
+        so the cost depends on the box size rather than the series length.
+        """
+        from PIL import Image, ImageDraw
+        try:
+            from src.chart import render_hourly_chart
+        except ImportError:
+            from chart import render_hourly_chart
+
+        times = hourly.get('time', [])
+        # ISO timestamps sort lexically, so bisect finds the current hour
+        start = max(bisect.bisect_right(times, current_time) - 1, 0) if current_time else 0
+        temps = hourly.get('temperature_2m', [])[start:start + hours]
+        precip = hourly.get('precipitation', [])[start:start + hours]
+
+        draw = ImageDraw.Draw(image)
+        x0, y0, x1, y1 = box
+        # Range labels on the left, chart in the remaining width
+        label_width = 30
+        chart_width = x1 - x0 - label_width
+        rendered = render_hourly_chart(temps, precip, chart_width, y1 - y0)
+        if rendered is None:
+            return
+        mask, (t_lo, t_hi) = rendered
+        chart = Image.fromarray(~mask)
+        image.paste(chart, (x0 + label_width, y0))
+
+        draw.text((x0, y0), f"{round(t_hi)}°", font=self.font, fill=0)
+        draw.text((x0, y1 - 12), f"{round(t_lo)}°", font=self.font, fill=0)
 
     def clear(self):
         self.epd.Clear(0xFF)
+        self.last_buffer = None
+        self.base_image = None
+        self.frame_cache.mark_on_panel(False)
+        self.cache_on_panel = False
+        self.cached_weather = None
+        self.epd.sleep()
+
+    def reinit_panel(self, error=None):
+        """Re-initializes the driver after a panel fault.
+
+        The panel keeps showing its last image; only the controller state is
+        reset, so the next push must be a full refresh. Other errors are
+        ignored: the driver is fine.
+        """
+        if error is not None and not is_panel_fault(error):
+            return
+        logger.warning("Re-initializing the panel driver")
+        config = getattr(self.epd, "config", None)
+        if config is not None:
+            try:
+                config.module_exit()
+            except Exception as e:
+                logger.debug(f"module_exit during recovery: {e}")
+        if self.epd.init() not in (None, 0):
+            raise RuntimeError("Panel driver init failed")
+        self.partial_base_ready = False
+        # A refresh may have stopped halfway; make the next window update a full refresh
+        self.partial_count = MAX_PARTIAL_REFRESHES
+
+    def sleep(self):
+        """Puts the panel to sleep, keeping the current frame on screen."""
         self.epd.sleep()
 
 if __name__ == "__main__":
@@ -0,0 +1,109 @@
+import os
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def default_state_dir():
+    """Directory for persisted state.
+
+    systemd exports STATE_DIRECTORY when the unit sets StateDirectory=,
+    otherwise fall back to a per-user cache directory.
+    """
+    state_dir = os.environ.get("STATE_DIRECTORY")
+    if state_dir:
+        # STATE_DIRECTORY may hold several colon-separated paths
+        return state_dir.split(":")[0]
+    return os.path.join(os.path.expanduser("~"), ".cache", "weather-display")
+
+
+def atomic_write(path, data):
+    """Write bytes to path so a crash never leaves a half-written file."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class CachedFrame:
+    def __init__(self, buffer, weather, location_name, on_panel, etag=None, settings=None):
+        self.buffer = buffer
+        self.weather = weather
+        self.location_name = location_name
+        self.on_panel = on_panel
+        # Frame server ETag of this frame, when it came from a frame server
+        self.etag = etag
+        # Layout settings the frame was drawn with (DisplayService.render_settings())
+        self.settings = settings
+
+
+class FrameCache:
+    """Persists the last packed panel buffer and the forecast it was rendered from.
+
+    The buffer is stored exactly as handed to EPD.display(), so restoring it
+    needs neither PIL nor the network. `on_panel` records whether the panel
+    still shows that frame (e-paper keeps its image without power), letting a
+    restarted daemon skip the refresh altogether.
+    """
+
+    FRAME_FILE = "frame.bin"
+    META_FILE = "frame.json"
+
+    def __init__(self, state_dir=None):
+        self.state_dir = state_dir or default_state_dir()
+        self.frame_path = os.path.join(self.state_dir, self.FRAME_FILE)
+        self.meta_path = os.path.join(self.state_dir, self.META_FILE)
+
+    def load(self):
+        """Returns the cached frame, or None if there is no usable cache."""
+        try:
+            with open(self.meta_path, "r") as f:
+                meta = json.load(f)
+            with open(self.frame_path, "rb") as f:
+                buffer = bytearray(f.read())
+        except (OSError, ValueError) as e:
+            logger.info(f"No cached frame available ({e})")
+            return None
+
+        if hashlib.sha1(buffer).hexdigest() != meta.get("sha1"):
+            logger.warning("Cached frame does not match its checksum; ignoring it")
+            return None
+
+        return CachedFrame(buffer, meta.get("weather"), meta.get("location_name"), meta.get("on_panel", False),
+                           meta.get("etag"), meta.get("settings"))
+
+    def save(self, buffer, weather, location_name, on_panel=True, etag=None, settings=None):
+        buffer = bytes(buffer)
+        if not buffer:
+            return
+        meta = {
+            "sha1": hashlib.sha1(buffer).hexdigest(),
+            "location_name": location_name,
+            "weather": weather,
+            "on_panel": on_panel,
+            "etag": etag,
+            "settings": settings,
+        }
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+            # Frame first: the metadata checksum only validates once both are on disk
+            atomic_write(self.frame_path, buffer)
+            atomic_write(self.meta_path, json.dumps(meta).encode("utf-8"))
+        except OSError as e:
+            logger.warning(f"Could not persist frame: {e}")
+
+    def mark_on_panel(self, on_panel):
+        """Records whether the panel currently shows the cached frame."""
+        try:
+            with open(self.meta_path, "r") as f:
+                meta = json.load(f)
+            if meta.get("on_panel") == on_panel:
+                return
+            meta["on_panel"] = on_panel
+            atomic_write(self.meta_path, json.dumps(meta).encode("utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not update cached frame state: {e}")
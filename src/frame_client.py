@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import zlib
+import signal
+import logging
+import argparse
+import urllib.error
+import urllib.request
+
+# Add lib to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib'))
+
+try:
+    from src.display_service import DisplayService
+    from src.frame_codec import DELTA_IM, frame_etag, decode_delta
+except ImportError:
+    from display_service import DisplayService
+    from frame_codec import DELTA_IM, frame_etag, decode_delta
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 5 * 60
+
+
+class FrameClient:
+    """Fetches packed frames from a frame server and pushes them to the panel.
+
+    No rendering happens here. PIL, fonts and requests are never imported,
+    and an unchanged frame costs one 304 response.
+    """
+
+    def __init__(self, url, display_service, timeout=30):
+        self.url = url
+        self.display_service = display_service
+        self.timeout = timeout
+        # The restored frame is the delta base for the first request
+        self.etag = display_service.cached_etag
+
+    def poll(self):
+        """Checks for a new frame and shows it. Returns True if the panel was updated."""
+        headers = {}
+        base = self.display_service.last_buffer
+        if self.etag and base is not None:
+            headers["If-None-Match"] = self.etag
+            headers["A-IM"] = DELTA_IM
+
+        request = urllib.request.Request(self.url, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status = response.status
+                etag = response.headers.get("ETag")
+                body = response.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                logger.debug("Frame unchanged")
+            else:
+                logger.error(f"Frame server returned {e.code}")
+            return False
+        except OSError as e:
+            logger.error(f"Error fetching frame: {e}")
+            return False
+
+        delta = status == 226
+        try:
+            buffer = decode_delta(body, base) if delta else body
+        except (zlib.error, ValueError) as e:
+            logger.warning(f"Could not apply frame delta: {e}")
+            buffer = None
+        if buffer is None or etag != frame_etag(buffer):
+            # Without an ETag the next request asks for a full frame
+            self.etag = None
+            if delta:
+                logger.warning("Delta does not match the shown frame; requesting a full frame")
+                return self.poll()
+            logger.warning("Frame does not match its ETag; requesting a full frame next time")
+            return False
+
+        self.etag = etag
+        logger.info(f"Received frame {etag} ({len(body)} bytes{', delta' if delta else ''})")
+        return self.display_service.show_buffer(buffer, etag=etag)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show frames rendered by a frame server")
+    parser.add_argument("url", help="frame URL, e.g. http://server:8080/frames/birmingham-al")
+    parser.add_argument("--interval", type=int, default=POLL_INTERVAL, help="seconds between polls")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    display_service = DisplayService()
+    client = FrameClient(args.url, display_service)
+
+    # systemd stops units with SIGTERM; exit through the finally below
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        while True:
+            client.poll()
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        logger.info("Exiting...")
+    finally:
+        # Leave the last frame on screen
+        display_service.sleep()
+
+
+if __name__ == "__main__":
+    main()
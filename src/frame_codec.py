@@ -0,0 +1,25 @@
+import zlib
+import hashlib
+
+# Instance manipulation (RFC 3229) name for our delta format:
+# the XOR of the new frame with the client's base frame, deflated
+DELTA_IM = "xor+zlib"
+
+
+def frame_etag(buffer):
+    """Strong ETag for a packed frame; clients check it after applying a delta."""
+    return '"' + hashlib.sha1(bytes(buffer)).hexdigest()[:20] + '"'
+
+
+def xor_bytes(a, b):
+    # One big-int XOR instead of a per-byte loop; thin clients have no NumPy
+    return (int.from_bytes(a, "big") ^ int.from_bytes(b, "big")).to_bytes(len(a), "big")
+
+
+def encode_delta(new, base):
+    """Encodes new against base. Unchanged pixels XOR to zero and deflate to almost nothing."""
+    return zlib.compress(xor_bytes(bytes(new), bytes(base)), 9)
+
+
+def decode_delta(delta, base):
+    return xor_bytes(zlib.decompress(delta), bytes(base))
@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from src.weather_service import WeatherService
+    from src.display_service import DisplayService, HeadlessEPD
+    from src.frame_cache import FrameCache, default_state_dir
+    from src.frame_codec import DELTA_IM, frame_etag, encode_delta
+    from src.locations import Location, LocationIndex, load_locations
+    from src.rate_limit import ApiBudget
+except ImportError:
+    from weather_service import WeatherService
+    from display_service import DisplayService, HeadlessEPD
+    from frame_cache import FrameCache, default_state_dir
+    from frame_codec import DELTA_IM, frame_etag, encode_delta
+    from locations import Location, LocationIndex, load_locations
+    from rate_limit import ApiBudget
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = 15 * 60
+# Previous frames kept per key as delta bases for clients that lag behind
+MAX_DELTA_BASES = 4
+LAYOUTS = ("daily", "hourly")
+
+
+class FrameEntry:
+    def __init__(self):
+        # (etag, buffer), replaced as a whole so readers never see a mismatched pair
+        self.frame = None
+        self.weather = None
+        self.checked_at = None
+        # Previous buffers by ETag, also replaced as a whole
+        self.bases = OrderedDict()
+        # Serializes refreshes of this key, so each fetch is single-flight
+        self.lock = threading.Lock()
+        self.refreshing = False
+
+
+class FrameStore:
+    """Renders packed frames per (location, layout) and keeps recent ones as delta bases.
+
+    A frame is re-rendered only when the forecast behind it changes; the
+    WeatherService cache makes repeated checks within its TTL free. Each key
+    refreshes on its own: a stale frame keeps being served while a
+    background thread refreshes it, so a slow upstream fetch never holds up
+    other locations or revalidations.
+    """
+
+    def __init__(self, index, weather_service, refresh_interval=REFRESH_INTERVAL):
+        self.index = index
+        self.weather_service = weather_service
+        self.refresh_interval = refresh_interval
+        self.renderers = {}
+        self.entries = {}
+        # Guards the entries dict and the refreshing flags; never held across a fetch
+        self.lock = threading.Lock()
+        # Renderers keep per-frame state, so renders run one at a time
+        self.render_lock = threading.Lock()
+
+    def renderer(self, layout):
+        renderer = self.renderers.get(layout)
+        if renderer is None:
+            cache_dir = os.path.join(default_state_dir(), "server", layout)
+            renderer = DisplayService(epd=HeadlessEPD(), frame_cache=FrameCache(cache_dir), layout=layout)
+            self.renderers[layout] = renderer
+        return renderer
+
+    def stale(self, entry):
+        return entry.checked_at is None or time.monotonic() - entry.checked_at >= self.refresh_interval
+
+    def get(self, slug, layout):
+        """Returns the current FrameEntry, or None if no frame could be produced."""
+        location = self.index.by_slug.get(slug)
+        if location is None or layout not in LAYOUTS:
+            return None
+
+        with self.lock:
+            entry = self.entries.setdefault((slug, layout), FrameEntry())
+            background = entry.frame is not None and not entry.refreshing and self.stale(entry)
+            if background:
+                entry.refreshing = True
+        if background:
+            threading.Thread(target=self._refresh_in_background, args=(entry, location, layout),
+                             name=f"refresh-{slug}-{layout}", daemon=True).start()
+        elif entry.frame is None:
+            # Nothing to serve yet: wait for the first render, which runs once per key
+            with entry.lock:
+                if entry.frame is None and self.stale(entry):
+                    self._refresh(entry, location, layout)
+        return entry if entry.frame is not None else None
+
+    def _refresh_in_background(self, entry, location, layout):
+        try:
+            with entry.lock:
+                self._refresh(entry, location, layout)
+        except Exception as e:
+            logger.error(f"Refreshing the {layout} frame for {location.name} failed: {e}", exc_info=True)
+        finally:
+            with self.lock:
+                entry.refreshing = False
+
+    def _refresh(self, entry, location, layout):
+        weather = self.weather_service.get_current_weather(lat=location.lat, lon=location.lon, priority=location.priority)
+        entry.checked_at = time.monotonic()
+        if weather is None or weather is entry.weather:
+            # Keep serving the last good frame
+            return
+
+        with self.render_lock:
+            buffer = self.renderer(layout).render(weather, location_name=location.name)
+        entry.weather = weather
+        if buffer is None:
+            return
+        buffer = bytes(buffer)
+        etag = frame_etag(buffer)
+        if entry.frame is not None and etag == entry.frame[0]:
+            return
+
+        if entry.frame is not None:
+            # Bases first: a reader holding the old frame still finds every older base
+            bases = OrderedDict(entry.bases)
+            bases[entry.frame[0]] = entry.frame[1]
+            while len(bases) > MAX_DELTA_BASES:
+                bases.popitem(last=False)
+            entry.bases = bases
+        entry.frame = (etag, buffer)
+        logger.info(f"Rendered {layout} frame for {location.name} ({etag})")
+
+
+class FrameRequestHandler(BaseHTTPRequestHandler):
+    """GET /frames lists keys; GET /frames/<location>?layout=<layout> returns a packed frame.
+
+    If-None-Match with the current ETag gets 304. Sending `A-IM: xor+zlib`
+    as well returns 226 with a delta against the frame named in If-None-Match,
+    when the server still has it.
+    """
+
+    store = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        if parts == ["frames"]:
+            body = json.dumps(sorted(self.store.index.by_slug)).encode("utf-8")
+            self._send(200, body, content_type="application/json")
+            return
+        if len(parts) != 2 or parts[0] != "frames":
+            self._send(404, b"")
+            return
+
+        layout = parse_qs(url.query).get("layout", ["daily"])[0]
+        entry = self.store.get(parts[1], layout)
+        if entry is None:
+            self._send(404, b"")
+            return
+
+        etag, buffer = entry.frame
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        client_etag = self.headers.get("If-None-Match")
+        if client_etag == etag:
+            self._send(304, None, headers)
+            return
+
+        base = entry.bases.get(client_etag)
+        if base is not None and DELTA_IM in self.headers.get("A-IM", ""):
+            headers["IM"] = DELTA_IM
+            headers["Delta-Base"] = client_etag
+            self._send(226, encode_delta(buffer, base), headers)
+        else:
+            self._send(200, buffer, headers)
+
+    def _send(self, status, body, headers=None, content_type="application/octet-stream"):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body is not None:
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render weather frames once and serve them to thin clients")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--locations", default=os.environ.get("WEATHER_LOCATIONS"),
+                        help="JSON or CSV locations file")
+    parser.add_argument("--interval", type=int, default=REFRESH_INTERVAL,
+                        help="seconds between forecast checks per frame")
+    parser.add_argument("--provider", action="append", metavar="URL",
+                        help="Open-Meteo compatible forecast URL; repeat to add hedging/fallback providers")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.locations:
+        locations = load_locations(args.locations)
+    else:
+        locations = [Location("Birmingham, AL", 33.5186, -86.8104)]
+    index = LocationIndex(locations)
+    weather_service = WeatherService(cache_ttl=args.interval, grid_cell_size=index.cell_size, budget=ApiBudget())
+    if args.provider:
+        weather_service.configure_providers([{"url": url} for url in args.provider])
+
+    FrameRequestHandler.store = FrameStore(index, weather_service, args.interval)
+    server = ThreadingHTTPServer((args.host, args.port), FrameRequestHandler)
+    logger.info(f"Serving {len(index)} locations on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
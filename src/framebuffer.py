@@ -0,0 +1,285 @@
+import os
+import mmap
+import stat
+import struct
+import logging
+
+try:
+    from src.frame_cache import default_state_dir
+except ImportError:
+    from frame_cache import default_state_dir
+
+logger = logging.getLogger(__name__)
+
+LAYER_MAGIC = b"WXLAYER1"
+# magic, sequence number (odd while a write is in progress), z order, width, height
+LAYER_HEADER = struct.Struct("<8sQiHH")
+SEQ_OFFSET = 8
+Z_OFFSET = 16
+# The logical canvas: landscape, as DisplayService draws it
+CANVAS_WIDTH = 250
+CANVAS_HEIGHT = 122
+LAYER_SUFFIX = ".layer"
+LAYER_DIR_ENV = "WEATHER_LAYER_DIR"
+# Attempts at a consistent read of a layer that is being written
+READ_ATTEMPTS = 3
+
+
+def default_layer_dir():
+    if os.environ.get(LAYER_DIR_ENV):
+        return os.environ[LAYER_DIR_ENV]
+    # tmpfs: layer writes never reach the SD card
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm/weather-display"
+    return os.path.join(default_state_dir(), "layers")
+
+
+def plane_size(width=CANVAS_WIDTH, height=CANVAS_HEIGHT):
+    # PIL's 1-bit packing: rows padded to whole bytes, MSB first, 1 = white
+    return (width + 7) // 8 * height
+
+
+class Layer:
+    """A named overlay that another process draws into the panel's canvas.
+
+    The layer is a memory-mapped file with two 1-bit planes in the
+    landscape canvas layout: pixels (1 = white, as PIL's mode "1") and a
+    mask (1 = this layer covers the pixel). Writes go straight into the
+    mapping; a sequence number, odd while a write is in progress, lets the
+    compositor detect changes and skip torn reads without any locking.
+
+        layer = Layer("alerts", z=10)
+        layer.write(image)          # 250x122 PIL image, black pixels are drawn
+        layer.clear()
+    """
+
+    def __init__(self, name, z=0, directory=None):
+        self.name = name
+        self.directory = directory or default_layer_dir()
+        self.path = os.path.join(self.directory, name + LAYER_SUFFIX)
+        self.size = plane_size()
+        if not os.path.exists(self.path):
+            self._create(z)
+        with open(self.path, "r+b") as f:
+            self.mm = mmap.mmap(f.fileno(), 0)
+        if struct.unpack_from("<i", self.mm, Z_OFFSET)[0] != z:
+            seq = self._begin()
+            struct.pack_into("<i", self.mm, Z_OFFSET, z)
+            self._end(seq)
+
+    def _create(self, z):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(LAYER_HEADER.pack(LAYER_MAGIC, 0, z, CANVAS_WIDTH, CANVAS_HEIGHT))
+            f.write(b"\xff" * self.size + b"\0" * self.size)
+        # Renamed into place, so the compositor never sees a partial file
+        os.replace(tmp, self.path)
+
+    def write_planes(self, pixels, mask):
+        """Replaces the layer with packed pixel and mask planes (plane_size() bytes each)."""
+        if len(pixels) != self.size or len(mask) != self.size:
+            raise ValueError(f"Layer planes must be {self.size} bytes")
+        seq = self._begin()
+        start = LAYER_HEADER.size
+        self.mm[start:start + self.size] = pixels
+        self.mm[start + self.size:start + 2 * self.size] = mask
+        self._end(seq)
+
+    def _begin(self):
+        # Odd sequence number: readers skip the layer until _end()
+        seq = struct.unpack_from("<Q", self.mm, SEQ_OFFSET)[0] | 1
+        struct.pack_into("<Q", self.mm, SEQ_OFFSET, seq)
+        return seq
+
+    def _end(self, seq):
+        struct.pack_into("<Q", self.mm, SEQ_OFFSET, seq + 1)
+
+    def write(self, image, mask=None):
+        """Draws a 250x122 image. Without a mask, its black pixels are drawn and the rest is transparent."""
+        from PIL import ImageChops
+        image = image.convert("1")
+        if image.size != (CANVAS_WIDTH, CANVAS_HEIGHT):
+            raise ValueError(f"Layer images must be {CANVAS_WIDTH}x{CANVAS_HEIGHT}")
+        mask = ImageChops.invert(image) if mask is None else mask.convert("1")
+        self.write_planes(image.tobytes(), mask.tobytes())
+
+    def clear(self):
+        self.write_planes(b"\xff" * self.size, b"\0" * self.size)
+
+    def remove(self):
+        self.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        self.mm.close()
+
+
+class _LayerFile:
+    # The compositor's read-only view of one layer file. Read with pread rather
+    # than mapped: a layer truncated under a mapping would SIGBUS the daemon,
+    # while a short read only makes it an invalid layer.
+    def __init__(self, path, size):
+        self.length = LAYER_HEADER.size + 2 * size
+        # Non-blocking and no symlinks: anyone who can write the directory could plant a FIFO
+        self.fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK | getattr(os, "O_NOFOLLOW", 0))
+        try:
+            st = os.fstat(self.fd)
+            # Tells a layer apart from a new file later created under the same name
+            self.identity = (st.st_dev, st.st_ino)
+            if not stat.S_ISREG(st.st_mode) or st.st_size < self.length:
+                raise ValueError(f"{path} is not a {self.length}-byte layer file")
+            magic, _, self.z, width, height = LAYER_HEADER.unpack(os.pread(self.fd, LAYER_HEADER.size, 0))
+            if magic != LAYER_MAGIC or (width, height) != (CANVAS_WIDTH, CANVAS_HEIGHT):
+                raise ValueError(f"{path} is not a {CANVAS_WIDTH}x{CANVAS_HEIGHT} layer")
+        except Exception:
+            os.close(self.fd)
+            raise
+        # Sequence number of the last composed snapshot, and that snapshot
+        self.seen = None
+        self.last = None
+
+    def check(self):
+        if os.fstat(self.fd).st_size < self.length:
+            raise ValueError("layer file was truncated")
+
+    def seq(self):
+        data = os.pread(self.fd, 8, SEQ_OFFSET)
+        if len(data) < 8:
+            raise ValueError("layer file was truncated")
+        return struct.unpack("<Q", data)[0]
+
+    def snapshot(self, size):
+        """Returns (seq, pixels, mask) from a consistent read, or the last one if a write kept getting in the way.
+
+        Returns None if no read has succeeded yet.
+
+        Raises ValueError if the file no longer holds a whole layer.
+        """
+        for _ in range(READ_ATTEMPTS):
+            before = self.seq()
+            if before & 1:
+                continue
+            data = os.pread(self.fd, self.length - Z_OFFSET, Z_OFFSET)
+            if len(data) < self.length - Z_OFFSET:
+                raise ValueError("layer file was truncated")
+            if self.seq() == before:
+                self.z = struct.unpack_from("<i", data, 0)[0]
+                planes = data[LAYER_HEADER.size - Z_OFFSET:]
+                self.last = before, planes[:size], planes[size:]
+                return self.last
+        # Drawn as it was before the write started rather than flickering off;
+        # seen keeps the old sequence number, so the next poll composes it again
+        return self.last
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _stamp(st):
+    # Ignored files are not held open, so their inode may be reused; the change time tells them apart
+    return st.st_dev, st.st_ino, st.st_ctime_ns
+
+
+class Compositor:
+    """Merges the overlay layers in a directory over the daemon's frame.
+
+    The daemon keeps sole ownership of the driver: other processes only
+    write their Layer files, and the daemon polls changed() and pushes the
+    composed frame itself. changed() and compose() must not run at the same
+    time; the daemon calls both under its panel lock.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or default_layer_dir()
+        # Only the daemon's user may add layers unless the directory is set up otherwise
+        os.makedirs(self.directory, mode=0o755, exist_ok=True)
+        self.size = plane_size()
+        self.layers = {}
+        # Files that are not valid layers, by name and _stamp(), so each is only reported once
+        self.ignored = {}
+
+    def changed(self):
+        """True if a layer was added, removed or written since the last compose()."""
+        try:
+            names = {n[:-len(LAYER_SUFFIX)] for n in os.listdir(self.directory) if n.endswith(LAYER_SUFFIX)}
+        except OSError:
+            names = set()
+        files = {}
+        for name in names:
+            try:
+                st = os.stat(os.path.join(self.directory, name + LAYER_SUFFIX), follow_symlinks=False)
+            except OSError:
+                continue
+            files[name] = st
+
+        changed = False
+        for name, layer in list(self.layers.items()):
+            st = files.get(name)
+            # An open layer's inode cannot be reused, so the inode number identifies it
+            if st is None or (st.st_dev, st.st_ino) != layer.identity:
+                # Removed, or replaced by a new file under the same name
+                self.layers.pop(name).close()
+                changed = True
+        self.ignored = {name: stamp for name, stamp in self.ignored.items()
+                        if name in files and _stamp(files[name]) == stamp}
+        for name in files.keys() - self.layers.keys() - self.ignored.keys():
+            try:
+                self.layers[name] = _LayerFile(os.path.join(self.directory, name + LAYER_SUFFIX), self.size)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring layer {name}: {e}")
+                self.ignored[name] = _stamp(files[name])
+                continue
+            changed = True
+        for name, layer in list(self.layers.items()):
+            try:
+                layer.check()
+                if layer.seq() != layer.seen:
+                    changed = True
+            except (OSError, ValueError) as e:
+                self._drop(name, e)
+                changed = True
+        return changed
+
+    def _drop(self, name, error):
+        # A layer that stopped being valid is left out until its file is replaced
+        logger.warning(f"Ignoring layer {name}: {error}")
+        self.layers.pop(name).close()
+        try:
+            self.ignored[name] = _stamp(os.stat(os.path.join(self.directory, name + LAYER_SUFFIX), follow_symlinks=False))
+        except OSError:
+            pass
+
+    def compose(self, image):
+        """Returns the landscape image with every layer drawn over it, lowest z first."""
+        if not self.layers:
+            return image
+        import numpy as np
+        from PIL import Image
+        canvas = np.frombuffer(image.convert("1").tobytes(), dtype=np.uint8).copy()
+        snapshots = []
+        for name, layer in list(self.layers.items()):
+            try:
+                snapshot = layer.snapshot(self.size)
+            except (OSError, ValueError) as e:
+                # One bad layer must not cost the whole frame
+                self._drop(name, e)
+                continue
+            if snapshot is None:
+                # First write still in progress; picked up on the next poll
+                continue
+            layer.seen = snapshot[0]
+            snapshots.append((layer.z, name, snapshot))
+        for _, _, (_, pixels, mask) in sorted(snapshots, key=lambda s: s[:2]):
+            pixels = np.frombuffer(pixels, dtype=np.uint8)
+            mask = np.frombuffer(mask, dtype=np.uint8)
+            canvas = (canvas & ~mask) | (pixels & mask)
+        return Image.frombytes("1", image.size, canvas.tobytes())
+
+    def close(self):
+        for layer in self.layers.values():
+            layer.close()
+        self.layers = {}
@@ -0,0 +1,266 @@
+import os
+import re
+import csv
+import mmap
+import struct
+import bisect
+import logging
+import argparse
+import unicodedata
+
+try:
+    from src.frame_cache import default_state_dir, atomic_write
+except ImportError:
+    from frame_cache import default_state_dir, atomic_write
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"WXGEO1\0\0"
+# magic, key count, place count
+HEADER = struct.Struct("<8sII")
+# key offset, key length, place number; sorted by key, then by population
+KEY_RECORD = struct.Struct("<IHI")
+# lat, lon, population, label offset, label length, country code, admin1 code
+PLACE_RECORD = struct.Struct("<ffIIH2s8s")
+# Keys scanned per prefix lookup before ranking; bounds very short prefixes
+MAX_PREFIX_SCAN = 5000
+GEOCODER_INDEX_ENV = "WEATHER_GEOCODER_INDEX"
+
+# GeoNames dump columns (https://download.geonames.org/export/dump/readme.txt)
+GEONAMES_NAME = 1
+GEONAMES_ASCII_NAME = 2
+GEONAMES_ALTERNATE_NAMES = 3
+GEONAMES_LAT = 4
+GEONAMES_LON = 5
+GEONAMES_COUNTRY = 8
+GEONAMES_ADMIN1 = 10
+GEONAMES_POPULATION = 14
+
+
+def default_index_path():
+    return os.environ.get(GEOCODER_INDEX_ENV) or os.path.join(default_state_dir(), "places.idx")
+
+
+def normalize(name):
+    """Lookup key for a place name: accents, case and punctuation removed, e.g. "Zürich" -> "zurich"."""
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w\s]", " ", stripped.casefold()).split())
+
+
+class Place:
+    __slots__ = ("label", "lat", "lon", "population", "country", "admin1")
+
+    def __init__(self, label, lat, lon, population, country, admin1):
+        self.label = label
+        self.lat = lat
+        self.lon = lon
+        self.population = population
+        self.country = country
+        self.admin1 = admin1
+
+    def matches(self, qualifiers):
+        """True if every qualifier ("US", "AL", ...) is this place's country or admin1 code."""
+        codes = {self.country.casefold(), self.admin1.casefold()}
+        return all(q in codes for q in qualifiers)
+
+    def __repr__(self):
+        return f"Place({self.label!r}, {self.lat:.4f}, {self.lon:.4f}, population={self.population})"
+
+
+def build_index(dump_path, out_path, min_population=0, alternate_names=False):
+    """Builds a geocoder index from a GeoNames dump such as cities500.txt.
+
+    Each place is keyed by its name and ASCII name, and optionally by its
+    alternate names (several times larger). Returns the number of places.
+    """
+    places = []
+    keys = []
+    with open(dump_path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+            population = int(row[GEONAMES_POPULATION] or 0)
+            if population < min_population:
+                continue
+            number = len(places)
+            places.append((row[GEONAMES_NAME], float(row[GEONAMES_LAT]), float(row[GEONAMES_LON]), population,
+                           row[GEONAMES_COUNTRY], row[GEONAMES_ADMIN1]))
+            names = {row[GEONAMES_NAME], row[GEONAMES_ASCII_NAME]}
+            if alternate_names and row[GEONAMES_ALTERNATE_NAMES]:
+                names.update(row[GEONAMES_ALTERNATE_NAMES].split(","))
+            for key in {normalize(n) for n in names}:
+                if key:
+                    keys.append((key.encode("utf-8"), -population, number))
+    keys.sort()
+
+    strings = bytearray()
+    string_offsets = {}
+
+    def intern(data):
+        offset = string_offsets.get(data)
+        if offset is None:
+            offset = string_offsets[data] = len(strings)
+            strings.extend(data)
+        return offset
+
+    key_table = bytearray()
+    for key, _, number in keys:
+        key_table += KEY_RECORD.pack(intern(key), len(key), number)
+    place_table = bytearray()
+    for name, lat, lon, population, country, admin1 in places:
+        label = ", ".join(part for part in (name, admin1 if country == "US" else "", country) if part).encode("utf-8")
+        place_table += PLACE_RECORD.pack(lat, lon, population, intern(label), len(label),
+                                         country.encode("ascii")[:2], admin1.encode("ascii", "ignore")[:8])
+
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    atomic_write(out_path, HEADER.pack(MAGIC, len(keys), len(places)) + key_table + place_table + strings)
+    logger.info(f"Indexed {len(places)} places under {len(keys)} names into {out_path}")
+    return len(places)
+
+
+class _Keys:
+    # Sequence view over the sorted keys, for bisect
+    def __init__(self, geocoder):
+        self.geocoder = geocoder
+
+    def __len__(self):
+        return self.geocoder.key_count
+
+    def __getitem__(self, i):
+        return self.geocoder._key(i)[0]
+
+
+class Geocoder:
+    """Offline place-name lookup over an index built by build_index().
+
+    The index is memory-mapped and searched in place: lookups are binary
+    searches over a sorted key table, and only the touched pages become
+    resident.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_index_path()
+        with open(self.path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.key_count, self.place_count = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            self.mm.close()
+            raise ValueError(f"{self.path} is not a geocoder index")
+        self.places_offset = HEADER.size + self.key_count * KEY_RECORD.size
+        self.strings_offset = self.places_offset + self.place_count * PLACE_RECORD.size
+        self.keys = _Keys(self)
+
+    def _key(self, i):
+        offset, length, number = KEY_RECORD.unpack_from(self.mm, HEADER.size + i * KEY_RECORD.size)
+        start = self.strings_offset + offset
+        return self.mm[start:start + length], number
+
+    def _place(self, number):
+        lat, lon, population, label_offset, label_len, country, admin1 = PLACE_RECORD.unpack_from(
+            self.mm, self.places_offset + number * PLACE_RECORD.size)
+        start = self.strings_offset + label_offset
+        return Place(self.mm[start:start + label_len].decode("utf-8"), lat, lon, population,
+                     country.rstrip(b"\0").decode("ascii"), admin1.rstrip(b"\0").decode("ascii"))
+
+    def search(self, query, limit=10, exact=False):
+        """Places whose name starts with the query's name part, best matches first.
+
+        The query may end in comma-separated qualifiers, country or admin1
+        codes, to disambiguate: "Birmingham, AL" or "Birmingham, GB".
+        Exact name matches rank above prefix matches, then by population.
+        With exact=True, only exact name matches are returned.
+        """
+        name, *qualifiers = query.split(",")
+        prefix = normalize(name).encode("utf-8")
+        qualifiers = [q.strip().casefold() for q in qualifiers if q.strip()]
+        if not prefix:
+            return []
+
+        # No key contains 0xff, so this bounds every key starting with prefix
+        lo = bisect.bisect_left(self.keys, prefix)
+        if exact:
+            hi = bisect.bisect_right(self.keys, prefix, lo)
+        else:
+            hi = bisect.bisect_left(self.keys, prefix + b"\xff", lo)
+        seen = set()
+        results = []
+        for i in range(lo, min(hi, lo + MAX_PREFIX_SCAN)):
+            key, number = self._key(i)
+            if number in seen:
+                continue
+            seen.add(number)
+            place = self._place(number)
+            if place.matches(qualifiers):
+                results.append((key != prefix, -place.population, place.label, place))
+        results.sort(key=lambda r: r[:3])
+        return [r[3] for r in results[:limit]]
+
+    def resolve(self, query):
+        """The best place whose name is exactly the query's name part, or None.
+
+        Unlike search(), a prefix never matches, so a truncated or misspelled
+        name is not silently taken for another place. Ambiguous names
+        resolve to the most populous match; add a country or state code to
+        pick another. Qualifiers must match those codes: the index keeps no
+        state names, and dropping a qualifier could pick a place elsewhere.
+        """
+        matches = self.search(query, limit=3, exact=True)
+        if not matches:
+            return None
+        best = matches[0]
+        others = [m for m in matches[1:] if normalize(m.label.split(",")[0]) == normalize(best.label.split(",")[0])]
+        if others:
+            logger.info(f"{query!r} is ambiguous; using {best.label} over {', '.join(m.label for m in others)}")
+        return best
+
+    def close(self):
+        self.mm.close()
+
+
+_geocoders = {}
+
+
+def geocode(name, index_path=None):
+    """Resolves a location name to (lat, lon) with the shared index; raises ValueError if unknown."""
+    path = index_path or default_index_path()
+    geocoder = _geocoders.get(path)
+    if geocoder is None:
+        try:
+            geocoder = _geocoders[path] = Geocoder(path)
+        except OSError as e:
+            raise ValueError(f"Cannot look up {name!r} without a geocoder index ({e}); "
+                             f"build one with `python src/geocoder.py build cities500.txt`") from e
+    place = geocoder.resolve(name)
+    if place is None:
+        suggestions = geocoder.search(name, limit=3) or geocoder.search(name.split(",")[0], limit=3)
+        hint = f"; did you mean {' or '.join(repr(p.label) for p in suggestions)}?" if suggestions else ""
+        raise ValueError(f"Unknown location {name!r}{hint}")
+    logger.info(f"Resolved {name!r} to {place.label} ({place.lat:.4f}, {place.lon:.4f})")
+    # Stored as float32; more digits would only be noise
+    return round(place.lat, 5), round(place.lon, 5)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the offline geocoder index")
+    parser.add_argument("--index", default=default_index_path(), help="index file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="index a GeoNames dump, e.g. cities500.txt")
+    build.add_argument("dump")
+    build.add_argument("--min-population", type=int, default=0)
+    build.add_argument("--alternate-names", action="store_true", help="also index alternate and local names")
+    search = commands.add_parser("search", help="look up a place name or prefix")
+    search.add_argument("query")
+    search.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "build":
+        build_index(args.dump, args.index, args.min_population, args.alternate_names)
+        return
+    geocoder = Geocoder(args.index)
+    for place in geocoder.search(args.query, args.limit):
+        print(f"{place.label}\t{place.lat:.4f}\t{place.lon:.4f}\t{place.population}")
+    geocoder.close()
+
+
+if __name__ == "__main__":
+    main()
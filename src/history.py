@@ -0,0 +1,215 @@
+import os
+import mmap
+import time
+import struct
+import logging
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+try:
+    from src.frame_cache import default_state_dir
+    from src.locations import slugify
+except ImportError:
+    from frame_cache import default_state_dir
+    from locations import slugify
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"WXHIST1\0"
+# magic, capacity, record size, next sequence number
+HEADER = struct.Struct("<8sIIQ")
+HEADER_SIZE = 32
+
+RECORD_DTYPE = np.dtype([
+    ("seq", "<u8"),
+    ("timestamp", "<f8"),
+    ("temperature", "<f4"),
+    ("apparent_temperature", "<f4"),
+    ("windspeed", "<f4"),
+    ("winddirection", "<f4"),
+    ("weathercode", "<i2"),
+    ("is_day", "u1"),
+    ("_pad", "u1", (5,)),
+])
+
+# Hourly records for 30 days
+DEFAULT_CAPACITY = 24 * 30
+# Observations closer together than this are not stored
+MIN_INTERVAL = 10 * 60
+
+
+def _value(current, key):
+    value = current.get(key)
+    return np.nan if value is None else value
+
+
+def observation_time(current):
+    """Returns when the `current` block was observed as a Unix time, or None if unknown."""
+    offset = current.get("utc_offset_seconds")
+    try:
+        observed = datetime.fromisoformat(current["time"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if observed.tzinfo is None:
+        if offset is None:
+            return None
+        observed = observed.replace(tzinfo=timezone(timedelta(seconds=offset)))
+    return observed.timestamp()
+
+
+class HistoryStore:
+    """Fixed-size ring buffer of observed conditions in a memory-mapped file.
+
+    Appends write one record in place and then bump the header sequence
+    number. Each record also carries its own sequence number, so a crash
+    between the two writes is repaired on open. Only the touched pages are
+    synced, which keeps SD-card writes to a page or two per append. File
+    size is fixed by capacity, whatever the uptime.
+    """
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY):
+        self.path = path
+        size = HEADER_SIZE + capacity * RECORD_DTYPE.itemsize
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            existing = os.fstat(fd).st_size
+            if existing == 0:
+                os.ftruncate(fd, size)
+                os.pwrite(fd, HEADER.pack(MAGIC, capacity, RECORD_DTYPE.itemsize, 0), 0)
+            else:
+                magic, file_capacity, record_size, _ = HEADER.unpack(os.pread(fd, HEADER.size, 0))
+                if magic != MAGIC or record_size != RECORD_DTYPE.itemsize:
+                    raise ValueError(f"{path} is not a compatible history file")
+                # An existing file keeps its capacity
+                capacity = file_capacity
+                size = HEADER_SIZE + capacity * RECORD_DTYPE.itemsize
+            self._mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        self.capacity = capacity
+        self.records = np.frombuffer(self._mmap, dtype=RECORD_DTYPE, count=capacity, offset=HEADER_SIZE)
+        self._recover()
+
+    @property
+    def next_seq(self):
+        return HEADER.unpack_from(self._mmap, 0)[3]
+
+    def _set_next_seq(self, seq):
+        struct.pack_into("<Q", self._mmap, 16, seq)
+
+    def _recover(self):
+        # A record written after the last header update is complete; count it
+        seq = self.next_seq
+        while self.records[seq % self.capacity]["seq"] == seq + 1:
+            seq += 1
+        if seq != self.next_seq:
+            logger.info(f"Recovered {seq - self.next_seq} history record(s) in {self.path}")
+            self._set_next_seq(seq)
+
+    def __len__(self):
+        return min(self.next_seq, self.capacity)
+
+    def append(self, current, timestamp=None):
+        """Stores the `current` block from WeatherService in O(1).
+
+        Records are keyed on the observation time, so refetching an
+        observation that is already stored does nothing.
+        """
+        if timestamp is None:
+            timestamp = observation_time(current) or time.time()
+        seq = self.next_seq
+        latest = self.latest()
+        if latest is not None and timestamp - latest["timestamp"] < MIN_INTERVAL:
+            return False
+
+        slot = seq % self.capacity
+        record = self.records[slot:slot + 1]
+        record["timestamp"] = timestamp
+        record["temperature"] = _value(current, "temperature")
+        record["apparent_temperature"] = _value(current, "apparent_temperature")
+        record["windspeed"] = _value(current, "windspeed")
+        record["winddirection"] = _value(current, "winddirection")
+        record["weathercode"] = current.get("weathercode") or 0
+        record["is_day"] = current.get("is_day", 1)
+        # Sequence numbers are stored +1 so an all-zero slot never looks valid
+        record["seq"] = seq + 1
+        self._sync(HEADER_SIZE + slot * RECORD_DTYPE.itemsize, RECORD_DTYPE.itemsize)
+
+        self._set_next_seq(seq + 1)
+        self._sync(0, HEADER_SIZE)
+        return True
+
+    def _sync(self, offset, length):
+        # msync only the pages covering this range
+        start = offset - offset % mmap.ALLOCATIONGRANULARITY
+        self._mmap.flush(start, offset + length - start)
+
+    def latest(self):
+        if self.next_seq == 0:
+            return None
+        return self.records[(self.next_seq - 1) % self.capacity]
+
+    def segments(self):
+        """Returns the stored records, oldest first, as at most two zero-copy views."""
+        seq = self.next_seq
+        if seq <= self.capacity:
+            return (self.records[:seq],)
+        split = seq % self.capacity
+        return (self.records[split:], self.records[:split])
+
+    def window(self, since):
+        """Returns views of the records with timestamp >= since, oldest first."""
+        views = []
+        for segment in self.segments():
+            # Timestamps ascend within each segment
+            start = np.searchsorted(segment["timestamp"], since)
+            if start < len(segment):
+                views.append(segment[start:])
+        return views
+
+    def value_at(self, timestamp, field="temperature"):
+        """Returns `field` from the record nearest to timestamp, or None."""
+        best = None
+        for segment in self.segments():
+            if len(segment) == 0:
+                continue
+            i = int(np.abs(segment["timestamp"] - timestamp).argmin())
+            if best is None or abs(segment[i]["timestamp"] - timestamp) < abs(best["timestamp"] - timestamp):
+                best = segment[i]
+        return None if best is None else float(best[field])
+
+    def close(self):
+        # Views into the map must be released before it can be closed
+        self.records = None
+        self._mmap.close()
+
+
+class HistoryArchive:
+    """One HistoryStore per location under the state directory."""
+
+    def __init__(self, directory=None, capacity=DEFAULT_CAPACITY):
+        self.directory = directory or os.path.join(default_state_dir(), "history")
+        self.capacity = capacity
+        self.stores = {}
+
+    def get(self, location_name):
+        store = self.stores.get(location_name)
+        if store is None:
+            os.makedirs(self.directory, exist_ok=True)
+            store = HistoryStore(os.path.join(self.directory, f"{slugify(location_name)}.ring"), self.capacity)
+            self.stores[location_name] = store
+        return store
+
+    def record(self, location_name, current):
+        try:
+            return self.get(location_name).append(current)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not record history for {location_name}: {e}")
+            return False
+
+    def close(self):
+        for store in self.stores.values():
+            store.close()
+        self.stores = {}
@@ -0,0 +1,135 @@
+import re
+import csv
+import json
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Roughly 2.5 km, the resolution of the finest regional models Open-Meteo
+# serves; sites closer than this get the same forecast anyway
+GRID_CELL_SIZE = 0.025
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def grid_cell(lat, lon, cell_size=GRID_CELL_SIZE):
+    """Returns the integer key of the grid cell containing lat/lon."""
+    return (math.floor(lat / cell_size), math.floor(lon / cell_size))
+
+
+def cell_center(cell, cell_size=GRID_CELL_SIZE):
+    """Returns the lat/lon at the middle of a grid cell."""
+    return ((cell[0] + 0.5) * cell_size, (cell[1] + 0.5) * cell_size)
+
+
+def slugify(name):
+    """File- and URL-safe key for a location name, e.g. "Birmingham, AL" -> "birmingham-al"."""
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class Location:
+    # Slots keep per-site memory small when loading thousands of sites
+    __slots__ = ("name", "lat", "lon", "cell", "priority")
+
+    def __init__(self, name, lat, lon, cell_size=GRID_CELL_SIZE, priority=0):
+        self.name = name
+        self.lat = float(lat)
+        self.lon = float(lon)
+        self.cell = grid_cell(self.lat, self.lon, cell_size)
+        # 0 = always fetched; higher values fall back to cached data first when the API budget runs low
+        self.priority = int(priority)
+
+    def __repr__(self):
+        return f"Location({self.name!r}, {self.lat}, {self.lon})"
+
+
+def location_from_row(row, cell_size=GRID_CELL_SIZE):
+    """Builds a Location from a config entry; without lat/lon, the name is looked up offline."""
+    if not isinstance(row, dict) or not row.get("name"):
+        raise ValueError(f"Location entry has no name: {row!r}")
+    lat, lon = row.get("lat"), row.get("lon")
+    if lat in (None, "") or lon in (None, ""):
+        try:
+            from src.geocoder import geocode
+        except ImportError:
+            from geocoder import geocode
+        lat, lon = geocode(row["name"])
+    return Location(row["name"], lat, lon, cell_size, row.get("priority") or 0)
+
+
+def load_locations(path, cell_size=GRID_CELL_SIZE):
+    """Loads locations from a JSON list or a CSV file with name[,lat,lon][,priority] columns."""
+    if path.endswith(".csv"):
+        with open(path, "r", newline="") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, "r") as f:
+            rows = json.load(f)
+    return [location_from_row(row, cell_size) for row in rows]
+
+
+class LocationIndex:
+    """Name and grid-cell index over a location list.
+
+    Locations in the same cell share one forecast, so callers fetch per cell
+    rather than per site.
+    """
+
+    def __init__(self, locations, cell_size=GRID_CELL_SIZE):
+        self.cell_size = cell_size
+        self.locations = list(locations)
+        self.by_name = {}
+        self.by_slug = {}
+        self.cells = {}
+        for location in self.locations:
+            self.by_name[location.name.casefold()] = location
+            self.by_slug[slugify(location.name)] = location
+            self.cells.setdefault(location.cell, []).append(location)
+        logger.info(f"Indexed {len(self.locations)} locations in {len(self.cells)} forecast cells")
+
+    def __len__(self):
+        return len(self.locations)
+
+    def get(self, name):
+        return self.by_name.get(name.casefold())
+
+    def in_cell(self, cell):
+        return self.cells.get(cell, [])
+
+    def nearest(self, lat, lon, max_km=50.0):
+        """Returns the closest location within max_km, or None.
+
+        Searches rings of cells outward from the query cell and stops once no
+        unsearched cell can hold anything closer than the best match.
+        """
+        center = grid_cell(lat, lon, self.cell_size)
+        # Degrees of latitude are ~111 km; longitude cells shrink towards the poles,
+        # so widen the lon search by 1/cos(lat)
+        cell_km = self.cell_size * 111.0
+        lat_rings = int(max_km / cell_km) + 1
+        lon_scale = 1.0 / max(math.cos(math.radians(lat)), 0.01)
+
+        best, best_km = None, max_km
+        for ring in range(lat_rings + 1):
+            if best is not None and (ring - 1) * cell_km > best_km:
+                break
+            lon_ring = int(math.ceil(ring * lon_scale))
+            for dlat in range(-ring, ring + 1):
+                for dlon in range(-lon_ring, lon_ring + 1):
+                    # Only the new cells on this ring's border
+                    if abs(dlat) != ring and abs(dlon) <= int(math.ceil((ring - 1) * lon_scale)):
+                        continue
+                    for location in self.cells.get((center[0] + dlat, center[1] + dlon), ()):
+                        d = haversine_km(lat, lon, location.lat, location.lon)
+                        if d <= best_km:
+                            best, best_km = location, d
+        return best
@@ -1,6 +1,5 @@
 import sys
 import os
-import time
 import logging
 
 # Add lib to path
@@ -9,50 +8,101 @@ sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__f
 try:
     from src.weather_service import WeatherService
     from src.display_service import DisplayService
+    from src.panels import MultiPanelDaemon, load_panel_configs
+    from src.locations import load_locations, GRID_CELL_SIZE
+    from src.config import Config, load_config
+    from src.rate_limit import ApiBudget
+    from src.daemon import WeatherDaemon
+    from src.profiling import profiler_from_env
+    from src.framebuffer import Compositor
 except ImportError:
     from weather_service import WeatherService
     from display_service import DisplayService
+    from panels import MultiPanelDaemon, load_panel_configs
+    from locations import load_locations, GRID_CELL_SIZE
+    from config import Config, load_config
+    from rate_limit import ApiBudget
+    from daemon import WeatherDaemon
+    from profiling import profiler_from_env
+    from framebuffer import Compositor
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Panels showing the same location within this window share one fetch
+SHARED_CACHE_TTL = 10 * 60
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.toml')
+
+def config_from_env():
+    """Settings for installs without a config file."""
+    locations_file = os.environ.get("WEATHER_LOCATIONS")
+    return Config(
+        locations=load_locations(locations_file) if locations_file else None,
+        layout=os.environ.get("WEATHER_LAYOUT", "daily"),
+        show_clock=os.environ.get("WEATHER_CLOCK", "1") != "0",
+        locations_file=locations_file,
+    )
+
 def main():
     logger.info("Starting Weather Display...")
-    weather_service = WeatherService()
+
+    panels_file = os.environ.get("WEATHER_PANELS")
+    if panels_file:
+        logger.info(f"Multi-panel mode using {panels_file}")
+        weather_service = WeatherService(cache_ttl=SHARED_CACHE_TTL, grid_cell_size=GRID_CELL_SIZE, budget=ApiBudget())
+        MultiPanelDaemon(load_panel_configs(panels_file), weather_service).run()
+        return
+
+    # Shows the last persisted frame straight away, before any network access
     display_service = DisplayService()
 
-    locations = [
-        {"name": "Birmingham, AL", "lat": 33.5186, "lon": -86.8104},
-        #{"name": "Calicut, Kerala", "lat": 11.2588, "lon": 75.7804}
-    ]
-    current_location_index = 0
+    config_path = os.environ.get("WEATHER_CONFIG", DEFAULT_CONFIG_PATH)
+    config = None
+    if os.path.exists(config_path):
+        try:
+            config = load_config(config_path)
+        except Exception as e:
+            # Still watched; a fixed file is applied without a restart
+            logger.error(f"Ignoring invalid config {config_path}: {e}")
+    if config is None:
+        config = config_from_env()
+    display_service.configure(
+        layout=config.layout,
+        show_clock=config.show_clock,
+        fonts=config.fonts,
+        wind_speed_unit=config.wind_speed_unit,
+    )
+
+    # Sites in the same forecast cell share one fetch and cache entry
+    weather_service = WeatherService(
+        cache_ttl=SHARED_CACHE_TTL,
+        grid_cell_size=GRID_CELL_SIZE if config.locations_file else None,
+        # Persisted, so restarts in a crash loop cannot exceed the API limits
+        budget=ApiBudget(),
+    )
+    weather_service.wind_speed_unit = config.wind_speed_unit
+    if config.providers:
+        weather_service.configure_providers(config.providers)
+
+    # NumPy-backed; imported only once the cached frame is on the panel
+    try:
+        from src.history import HistoryArchive
+    except ImportError:
+        from history import HistoryArchive
+
+    # Overlay layers from other local services (see framebuffer.Layer)
+    compositor = Compositor() if os.environ.get("WEATHER_OVERLAYS", "0") != "0" else None
 
     try:
-        while True:
-            location = locations[current_location_index]
-            logger.info(f"Fetching weather data for {location['name']}...")
-            weather = weather_service.get_current_weather(lat=location['lat'], lon=location['lon'])
-            
-            if weather:
-                logger.info(f"Weather fetched: {weather}")
-                logger.info("Updating display...")
-                display_service.update_display(weather, location_name=location['name'])
-            else:
-                logger.error("Failed to fetch weather data")
-
-            # Cycle to next location
-            current_location_index = (current_location_index + 1) % len(locations)
-
-            # Sleep for 60 minutes
-            logger.info("Sleeping for 60 minutes...")
-            time.sleep(60 * 60) 
-            
-    except KeyboardInterrupt:
-        logger.info("Exiting...")
-        display_service.clear()
+        # SIGTERM/SIGINT stop the daemon cleanly and leave the frame on screen.
+        # The config file is watched even if it does not exist yet.
+        WeatherDaemon(display_service, weather_service, config, history=HistoryArchive(), config_path=config_path,
+                      profiler=profiler_from_env(), compositor=compositor).run()
     except Exception as e:
+        # Stages recover from fetch, render and panel faults in process; this is
+        # the last resort. Leave the last good frame on screen for the restart.
         logger.error(f"An error occurred: {e}", exc_info=True)
-        display_service.clear()
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
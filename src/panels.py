@@ -0,0 +1,151 @@
+import os
+import json
+import signal
+import logging
+import threading
+
+try:
+    from src.display_service import DisplayService, create_epd
+    from src.frame_cache import FrameCache, default_state_dir
+    from src.locations import load_locations, location_from_row
+    from src.supervisor import Stage, StageFailed
+except ImportError:
+    from display_service import DisplayService, create_epd
+    from frame_cache import FrameCache, default_state_dir
+    from locations import load_locations, location_from_row
+    from supervisor import Stage, StageFailed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 60 * 60
+RETRY_INTERVAL = 60
+
+
+class PanelConfig:
+    def __init__(self, name, locations, pins=None, spi_bus=None, spi_device=None, interval=DEFAULT_INTERVAL):
+        self.name = name
+        self.locations = locations
+        self.pins = pins
+        self.spi_bus = spi_bus
+        self.spi_device = spi_device
+        self.interval = interval
+
+
+def load_panel_configs(path):
+    """Reads panel definitions from a JSON file.
+
+    {"panels": [{"name": "left", "spi_device": 1,
+                 "pins": {"rst": 5, "dc": 6, "busy": 13, "pwr": 19},
+                 "interval": 1800,
+                 "locations": [{"name": "Birmingham, AL", "lat": 33.5186, "lon": -86.8104}]}]}
+
+    "locations_file" may be given instead of "locations" to load them from a file.
+    """
+    with open(path, "r") as f:
+        data = json.load(f)
+
+    configs = []
+    for panel in data.get("panels", []):
+        pins = {f"{name.upper()}_PIN": value for name, value in panel.get("pins", {}).items()}
+        if "locations_file" in panel:
+            locations = load_locations(panel["locations_file"])
+        else:
+            locations = [location_from_row(l) for l in panel["locations"]]
+        configs.append(PanelConfig(
+            name=panel["name"],
+            locations=locations,
+            pins=pins or None,
+            spi_bus=panel.get("spi_bus"),
+            spi_device=panel.get("spi_device"),
+            interval=panel.get("interval", DEFAULT_INTERVAL),
+        ))
+    return configs
+
+
+class Panel:
+    """One panel with its own driver, frame cache and refresh schedule."""
+
+    def __init__(self, config):
+        self.config = config
+        self.display_service = None
+
+    def run(self, weather_service, stop_event):
+        # Driver init and the cached-frame restore both wait on BUSY, so they
+        # run in this panel's thread rather than serially at startup
+        epd = create_epd(self.config.pins, self.config.spi_bus, self.config.spi_device)
+        frame_cache = FrameCache(os.path.join(default_state_dir(), self.config.name))
+        self.display_service = DisplayService(epd=epd, frame_cache=frame_cache)
+        # Per-panel stages, so one panel's faults never touch another's driver
+        fetch_stage = Stage(f"{self.config.name} fetch", retries=2, backoff=5)
+        render_stage = Stage(f"{self.config.name} render")
+        panel_stage = Stage(f"{self.config.name} panel", retries=2, on_fault=self.display_service.reinit_panel)
+
+        location_index = 0
+        while not stop_event.is_set():
+            location = self.config.locations[location_index]
+            logger.info(f"[{self.config.name}] Fetching weather data for {location.name}...")
+            wait = RETRY_INTERVAL
+            try:
+                weather = fetch_stage.run(weather_service.get_current_weather,
+                                          lat=location.lat, lon=location.lon, priority=location.priority,
+                                          fallback=False)
+            except StageFailed:
+                weather = weather_service.stale_weather(location.lat, location.lon)
+            try:
+                if weather:
+                    buffer = render_stage.run(self.display_service.render, weather, location.name)
+                    if buffer is not None:
+                        panel_stage.run(self.display_service.show_buffer, buffer, weather, location.name)
+                        location_index = (location_index + 1) % len(self.config.locations)
+                        wait = self.config.interval
+                else:
+                    logger.error(f"[{self.config.name}] Failed to fetch weather data")
+            except StageFailed:
+                # Logged by the stage; the panel keeps its last good frame
+                pass
+
+            stop_event.wait(wait)
+
+
+class MultiPanelDaemon:
+    """Drives several panels from one process, sharing a WeatherService.
+
+    Each panel runs in its own thread. The BUSY wait sleeps, so one panel's
+    refresh does not hold up the others.
+    """
+
+    def __init__(self, panel_configs, weather_service):
+        self.panels = [Panel(config) for config in panel_configs]
+        self.weather_service = weather_service
+        self.stop_event = threading.Event()
+
+    def run(self):
+        # systemctl stop sends SIGTERM: stop between refreshes rather than mid-transfer
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop_event.set())
+        threads = []
+        for panel in self.panels:
+            thread = threading.Thread(target=self._run_panel, args=(panel,), name=f"panel-{panel.config.name}", daemon=True)
+            thread.start()
+            threads.append(thread)
+
+        try:
+            while not self.stop_event.is_set() and any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            logger.info("Exiting...")
+            self.stop_event.set()
+            for thread in threads:
+                thread.join()
+            # Leave the last frames on screen; they are restored from cache on next start
+            for panel in self.panels:
+                if panel.display_service is not None:
+                    panel.display_service.sleep()
+
+    def _run_panel(self, panel):
+        try:
+            panel.run(self.weather_service, self.stop_event)
+        except Exception as e:
+            logger.error(f"[{panel.config.name}] An error occurred: {e}", exc_info=True)
@@ -0,0 +1,162 @@
+import os
+import io
+import time
+import shutil
+import logging
+import pstats
+import cProfile
+import tracemalloc
+
+try:
+    from src.frame_cache import default_state_dir
+except ImportError:
+    from frame_cache import default_state_dir
+
+logger = logging.getLogger(__name__)
+
+# WEATHER_PROFILE=N profiles the first N cycles after startup
+PROFILE_ENV = "WEATHER_PROFILE"
+# Cycles profiled after SIGUSR1
+DEFAULT_PROFILE_CYCLES = 3
+# Profiling runs kept on disk; older ones are deleted
+MAX_PROFILE_RUNS = 5
+TRACEMALLOC_FRAMES = 10
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+# Shown with their callees in each summary
+FOCUS_FUNCTIONS = r"update_display|render|getbuffer|show_buffer|get_current_weather|fetch_weather"
+
+
+class CycleProfiler:
+    """Profiles whole daemon cycles on request.
+
+    While armed, every stage passed through call() runs under its own
+    cProfile profile, and tracemalloc compares a heap snapshot at the end
+    of each cycle with the one before it. Each run gets a timestamped
+    directory under `profiles/` in the state directory:
+
+        cycle-001-fetch.prof       raw stats, for pstats or snakeviz
+        cycle-001-render-2.prof    the second call of a stage in the same cycle
+        cycle-001.txt              top functions per stage, by cumulative time
+        cycle-001-malloc.txt       top allocation growth since the last cycle
+
+    Disarmed, call() is a plain function call and tracemalloc is off.
+    """
+
+    def __init__(self, directory=None, keep=MAX_PROFILE_RUNS):
+        self.directory = directory or os.path.join(default_state_dir(), "profiles")
+        self.keep = keep
+        self.remaining = 0
+        self.cycle = 0
+        self.run_dir = None
+        self.profiles = []
+        self.snapshot = None
+
+    @property
+    def active(self):
+        return self.remaining > 0
+
+    def arm(self, cycles=DEFAULT_PROFILE_CYCLES):
+        """Profiles the next `cycles` cycles. Re-arming while active extends the run."""
+        if self.active:
+            self.remaining = max(self.remaining, cycles)
+            return
+        self.run_dir = os.path.join(self.directory, time.strftime("%Y%m%d-%H%M%S"))
+        try:
+            os.makedirs(self.run_dir, exist_ok=True)
+        except OSError as e:
+            logger.error(f"Cannot profile, {self.run_dir} is not writable: {e}")
+            return
+        self._rotate()
+        self.remaining = cycles
+        self.cycle = 0
+        self.profiles = []
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        self.snapshot = self._take_snapshot()
+        logger.info(f"Profiling the next {cycles} cycles into {self.run_dir}")
+
+    def call(self, stage, func, *args, **kwargs):
+        """Runs func(*args, **kwargs), under cProfile while armed.
+
+        Call it in the thread doing the work (e.g. inside asyncio.to_thread)
+        so that thread's frames are the ones profiled.
+        """
+        if not self.active:
+            return func(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            self.profiles.append((stage, profile))
+
+    def end_cycle(self):
+        """Writes the stats of the cycle that just finished."""
+        if not self.active:
+            return
+        self.cycle += 1
+        prefix = os.path.join(self.run_dir, f"cycle-{self.cycle:03d}")
+        try:
+            self._write_stats(prefix)
+            self._write_allocations(prefix)
+        except OSError as e:
+            logger.error(f"Could not write profile for cycle {self.cycle}: {e}")
+        self.profiles = []
+
+        self.remaining -= 1
+        if not self.active:
+            tracemalloc.stop()
+            self.snapshot = None
+            logger.info(f"Profiling finished; results are in {self.run_dir}")
+
+    def _write_stats(self, prefix):
+        out = io.StringIO()
+        calls = {}
+        for stage, profile in self.profiles:
+            # A stage can run several times per cycle, e.g. a render per carousel frame
+            calls[stage] = calls.get(stage, 0) + 1
+            name = stage if calls[stage] == 1 else f"{stage}-{calls[stage]}"
+            profile.dump_stats(f"{prefix}-{name}.prof")
+            stats = pstats.Stats(profile, stream=out)
+            out.write(f"==== {name} ====\n")
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+            stats.print_callees(FOCUS_FUNCTIONS)
+        with open(f"{prefix}.txt", "w") as f:
+            f.write(out.getvalue())
+
+    def _write_allocations(self, prefix):
+        snapshot = self._take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        with open(f"{prefix}-malloc.txt", "w") as f:
+            f.write(f"traced: {current / 1024:.1f} KiB, peak: {peak / 1024:.1f} KiB\n\n")
+            for diff in snapshot.compare_to(self.snapshot, "lineno")[:TOP_ALLOCATIONS]:
+                f.write(f"{diff}\n")
+        self.snapshot = snapshot
+
+    def _take_snapshot(self):
+        # Leave out the profiler's own allocations
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, cProfile.__file__),
+            tracemalloc.Filter(False, pstats.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+
+    def _rotate(self):
+        runs = sorted(
+            name for name in os.listdir(self.directory)
+            if os.path.isdir(os.path.join(self.directory, name))
+        )
+        for name in runs[:-self.keep]:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+
+def profiler_from_env():
+    """Returns a CycleProfiler, armed when WEATHER_PROFILE is set to a cycle count."""
+    profiler = CycleProfiler()
+    cycles = os.environ.get(PROFILE_ENV)
+    if cycles:
+        try:
+            profiler.arm(int(cycles))
+        except ValueError:
+            logger.error(f"{PROFILE_ENV} must be a number of cycles, not {cycles!r}")
+    return profiler
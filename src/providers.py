@@ -0,0 +1,172 @@
+import time
+import logging
+from collections import deque
+
+try:
+    from src.rate_limit import parse_retry_after
+except ImportError:
+    from rate_limit import parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+# Seconds before a request is abandoned
+REQUEST_TIMEOUT = 30
+# Pause after a 429 without a usable Retry-After header
+DEFAULT_RETRY_AFTER = 60
+# Successful request latencies kept per provider
+LATENCY_WINDOW = 50
+# Below this many samples the default hedge delay is used
+MIN_LATENCY_SAMPLES = 5
+DEFAULT_HEDGE_DELAY = 5.0
+# A request slower than this share of recent ones is hedged
+HEDGE_PERCENTILE = 0.95
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after=None):
+        super().__init__(f"rate limited (Retry-After: {retry_after})")
+        self.retry_after = retry_after
+
+
+class LatencyTracker:
+    """Recent successful request latencies, in seconds."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, fraction):
+        if len(self.samples) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+class WeatherProvider:
+    """A forecast source.
+
+    fetch() returns the forecast in the shape DisplayService consumes,
+    whatever the source's own schema:
+
+        {
+            "latitude": float, "longitude": float,
+            "current": {"temperature", "apparent_temperature", "windspeed",
+                        "winddirection", "weathercode" (WMO), "is_day", "time",
+                        "utc_offset_seconds"},
+            "daily": {"time", "weathercode", "temperature_2m_max", "temperature_2m_min", ...},
+            "hourly": {"time", "temperature_2m", "precipitation"},
+        }
+
+    and raises on failure, or RateLimited when the source asks to back off.
+    """
+
+    name = "provider"
+
+    def __init__(self, budget=None):
+        # Optional ApiBudget for sources with call limits
+        self.budget = budget
+        self.blocked_until = 0
+        self.latency = LatencyTracker()
+
+    def acquire(self, priority=0):
+        """Returns True if a request may be sent now, taking it from the budget."""
+        if time.time() < self.blocked_until:
+            return False
+        return self.budget is None or self.budget.try_acquire(priority)
+
+    def rate_limited(self, retry_after):
+        seconds = parse_retry_after(retry_after)
+        if seconds is None:
+            seconds = DEFAULT_RETRY_AFTER
+        self.blocked_until = max(self.blocked_until, time.time() + seconds)
+        if self.budget is not None:
+            self.budget.block_for(seconds)
+
+    def hedge_delay(self, percentile=HEDGE_PERCENTILE):
+        """Seconds to wait on this provider before hedging with the next one."""
+        delay = self.latency.percentile(percentile)
+        return DEFAULT_HEDGE_DELAY if delay is None else delay
+
+    def fetch(self, lat, lon, wind_speed_unit="kmh"):
+        raise NotImplementedError
+
+
+class OpenMeteoProvider(WeatherProvider):
+    """Open-Meteo's forecast API, public or self-hosted (https://github.com/open-meteo/open-meteo)."""
+
+    def __init__(self, base_url=OPEN_METEO_URL, budget=None, name=None, timeout=REQUEST_TIMEOUT):
+        super().__init__(budget)
+        self.base_url = base_url
+        self.name = name or base_url
+        self.timeout = timeout
+
+    def fetch(self, lat, lon, wind_speed_unit="kmh"):
+        params = {
+            "latitude": lat,
+            "longitude": lon,
+            "current": "temperature_2m,apparent_temperature,relative_humidity_2m,weather_code,wind_speed_10m,wind_direction_10m,is_day",
+            "daily": "weathercode,temperature_2m_max,temperature_2m_min,sunrise,sunset",
+            "hourly": "temperature_2m,precipitation",
+            "forecast_hours": 48,
+            "wind_speed_unit": wind_speed_unit,
+            "timezone": "auto"
+        }
+        # Imported lazily: keeps startup fast enough to show the cached frame first
+        import requests
+        response = requests.get(self.base_url, params=params, timeout=self.timeout)
+        if response.status_code == 429:
+            raise RateLimited(response.headers.get("Retry-After"))
+        response.raise_for_status()
+        data = response.json()
+
+        # Transform to match expected format
+        current_data = data.get("current", {})
+        return {
+            # Where the forecast is for, so day and night can be worked out locally
+            "latitude": lat,
+            "longitude": lon,
+            "current": {
+                "temperature": current_data.get("temperature_2m"),
+                "apparent_temperature": current_data.get("apparent_temperature"),
+                "windspeed": current_data.get("wind_speed_10m"),
+                "winddirection": current_data.get("wind_direction_10m"),
+                "weathercode": current_data.get("weather_code"),
+                "is_day": 1 if current_data.get("is_day") else 0,
+                "time": current_data.get("time"),
+                # "time" is local to the location
+                "utc_offset_seconds": data.get("utc_offset_seconds")
+            },
+            "daily": data.get("daily"),
+            "hourly": data.get("hourly")
+        }
+
+
+PROVIDER_TYPES = {
+    "open-meteo": OpenMeteoProvider,
+}
+
+
+def create_providers(specs, budget=None):
+    """Builds providers from config entries, in order of preference.
+
+    Each entry is {"type": "open-meteo", "url": ..., "name": ...}; type
+    defaults to open-meteo and url to the public API. The budget, which
+    models the public API's limits, only applies to providers using it.
+    """
+    if not specs:
+        return [OpenMeteoProvider(budget=budget)]
+    providers = []
+    for spec in specs:
+        kind = spec.get("type", "open-meteo")
+        if kind not in PROVIDER_TYPES:
+            raise ValueError(f"Unknown weather provider type {kind!r}")
+        url = spec.get("url", OPEN_METEO_URL)
+        providers.append(PROVIDER_TYPES[kind](
+            base_url=url,
+            budget=budget if url == OPEN_METEO_URL else None,
+            name=spec.get("name"),
+        ))
+    return providers
@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+
+try:
+    from src.frame_cache import default_state_dir, atomic_write
+except ImportError:
+    from frame_cache import default_state_dir, atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Open-Meteo free tier limits: (name, calls, period in seconds)
+OPEN_METEO_LIMITS = [
+    ("minute", 600, 60),
+    ("hour", 5000, 60 * 60),
+    ("day", 10000, 24 * 60 * 60),
+]
+# Lower-priority requests stop once any bucket drops below this share of its capacity
+LOW_PRIORITY_RESERVE = 0.2
+
+
+class TokenBucket:
+    def __init__(self, capacity, period, tokens=None, updated=None):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity if tokens is None else tokens
+        self.updated = time.time() if updated is None else updated
+
+    def refill(self, now):
+        # Wall-clock time, so buckets keep refilling correctly across restarts
+        elapsed = max(now - self.updated, 0)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+
+def parse_retry_after(value, now=None):
+    """Returns the seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(when - (time.time() if now is None else now), 0)
+
+
+class ApiBudget:
+    """Token buckets for the API call limits, persisted in the state directory.
+
+    State survives restarts, so a crash loop under systemd cannot spend more
+    than the budget. A 429 Retry-After blocks all calls until it expires.
+    """
+
+    def __init__(self, path=None, limits=OPEN_METEO_LIMITS, reserve=LOW_PRIORITY_RESERVE):
+        self.path = path or os.path.join(default_state_dir(), "api_budget.json")
+        self.reserve = reserve
+        self.lock = threading.Lock()
+        self.blocked_until = 0
+        self.buckets = {name: TokenBucket(calls, period) for name, calls, period in limits}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.blocked_until = state.get("blocked_until", 0)
+        for name, saved in state.get("buckets", {}).items():
+            bucket = self.buckets.get(name)
+            if bucket is not None:
+                bucket.tokens = min(saved["tokens"], bucket.capacity)
+                bucket.updated = saved["updated"]
+
+    def _save(self):
+        state = {
+            "blocked_until": self.blocked_until,
+            "buckets": {name: {"tokens": b.tokens, "updated": b.updated} for name, b in self.buckets.items()},
+        }
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            atomic_write(self.path, json.dumps(state).encode("utf-8"))
+        except OSError as e:
+            logger.warning(f"Could not persist API budget: {e}")
+
+    def try_acquire(self, priority=0):
+        """Takes one call from every bucket. Returns False if the call should not be made.
+
+        priority 0 may use the whole budget; higher values are lower priority
+        and are refused once a bucket runs into its reserve.
+        """
+        with self.lock:
+            now = time.time()
+            if now < self.blocked_until:
+                return False
+            for bucket in self.buckets.values():
+                bucket.refill(now)
+                floor = bucket.capacity * self.reserve if priority > 0 else 0
+                if bucket.tokens < 1 + floor:
+                    return False
+            for bucket in self.buckets.values():
+                bucket.tokens -= 1
+            self._save()
+            return True
+
+    def block_for(self, seconds):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.time() + seconds)
+            logger.warning(f"API rate limited; pausing requests for {seconds:.0f} seconds")
+            self._save()
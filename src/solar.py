@@ -0,0 +1,92 @@
+import math
+import time
+
+# Sun center this far below the horizon at sunrise/sunset (refraction plus the solar radius)
+HORIZON_ELEVATION = -0.833
+DAY_SECONDS = 24 * 60 * 60
+# Days searched ahead for the next sunrise or sunset; beyond that it is polar day or night
+TRANSITION_SEARCH_DAYS = 3
+
+
+def _sun(timestamp):
+    """Returns (declination in degrees, equation of time in minutes) at a Unix time.
+
+    NOAA's low-precision solar position, accurate to about a minute for
+    sunrise and sunset between 1900 and 2100.
+    """
+    jc = (timestamp / DAY_SECONDS + 2440587.5 - 2451545.0) / 36525.0
+    mean_long = math.radians((280.46646 + jc * (36000.76983 + jc * 0.0003032)) % 360)
+    mean_anom = math.radians(357.52911 + jc * (35999.05029 - 0.0001537 * jc))
+    ecc = 0.016708634 - jc * (0.000042037 + 0.0000001267 * jc)
+    center = (math.sin(mean_anom) * (1.914602 - jc * (0.004817 + 0.000014 * jc))
+              + math.sin(2 * mean_anom) * (0.019993 - 0.000101 * jc)
+              + math.sin(3 * mean_anom) * 0.000289)
+    omega = math.radians(125.04 - 1934.136 * jc)
+    apparent_long = math.radians(math.degrees(mean_long) + center - 0.00569 - 0.00478 * math.sin(omega))
+    mean_obliquity = 23 + (26 + (21.448 - jc * (46.815 + jc * (0.00059 - jc * 0.001813))) / 60) / 60
+    obliquity = math.radians(mean_obliquity + 0.00256 * math.cos(omega))
+
+    declination = math.degrees(math.asin(math.sin(obliquity) * math.sin(apparent_long)))
+    y = math.tan(obliquity / 2) ** 2
+    equation_of_time = 4 * math.degrees(
+        y * math.sin(2 * mean_long)
+        - 2 * ecc * math.sin(mean_anom)
+        + 4 * ecc * y * math.sin(mean_anom) * math.cos(2 * mean_long)
+        - 0.5 * y * y * math.sin(4 * mean_long)
+        - 1.25 * ecc * ecc * math.sin(2 * mean_anom)
+    )
+    return declination, equation_of_time
+
+
+def solar_elevation(lat, lon, timestamp=None):
+    """Elevation of the sun's center above the horizon in degrees, without refraction."""
+    timestamp = time.time() if timestamp is None else timestamp
+    declination, equation_of_time = _sun(timestamp)
+    minutes = (timestamp % DAY_SECONDS) / 60
+    hour_angle = math.radians(((minutes + equation_of_time + 4 * lon) % 1440) / 4 - 180)
+    lat_r, decl_r = math.radians(lat), math.radians(declination)
+    cos_zenith = math.sin(lat_r) * math.sin(decl_r) + math.cos(lat_r) * math.cos(decl_r) * math.cos(hour_angle)
+    return 90 - math.degrees(math.acos(max(-1.0, min(1.0, cos_zenith))))
+
+
+def is_day(lat, lon, timestamp=None):
+    """True between sunrise and sunset at lat/lon."""
+    return solar_elevation(lat, lon, timestamp) > HORIZON_ELEVATION
+
+
+def sun_times(lat, lon, timestamp=None):
+    """Returns (sunrise, sunset) as Unix times for the UTC day containing timestamp.
+
+    Returns None when the sun stays above or below the horizon all day.
+    """
+    timestamp = time.time() if timestamp is None else timestamp
+    midnight = timestamp - timestamp % DAY_SECONDS
+    # Solve at the approximate local noon, then refine each event at its own time
+    noon = midnight + (720 - 4 * lon) * 60
+    events = []
+    for sign in (-1, 1):
+        estimate = noon
+        for _ in range(2):
+            declination, equation_of_time = _sun(estimate)
+            lat_r, decl_r = math.radians(lat), math.radians(declination)
+            cos_ha = ((math.sin(math.radians(HORIZON_ELEVATION)) - math.sin(lat_r) * math.sin(decl_r))
+                      / (math.cos(lat_r) * math.cos(decl_r)))
+            if not -1 <= cos_ha <= 1:
+                return None
+            hour_angle = math.degrees(math.acos(cos_ha))
+            estimate = midnight + (720 - 4 * lon - equation_of_time + sign * 4 * hour_angle) * 60
+        events.append(estimate)
+    return events[0], events[1]
+
+
+def next_transition(lat, lon, timestamp=None):
+    """Unix time of the next sunrise or sunset after timestamp, or None during polar day or night."""
+    timestamp = time.time() if timestamp is None else timestamp
+    for day in range(-1, TRANSITION_SEARCH_DAYS):
+        times = sun_times(lat, lon, timestamp + day * DAY_SECONDS)
+        if times is None:
+            continue
+        upcoming = [t for t in times if t > timestamp]
+        if upcoming:
+            return min(upcoming)
+    return None
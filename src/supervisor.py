@@ -0,0 +1,49 @@
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StageFailed(Exception):
+    def __init__(self, stage, error):
+        super().__init__(f"{stage} failed: {error}")
+        self.stage = stage
+        self.error = error
+
+
+class Stage:
+    """Runs one subsystem's work (fetch, render, panel) with bounded retries.
+
+    A failed attempt is logged and retried after an exponential backoff,
+    running on_fault(error) first, e.g. to re-initialize the driver. After
+    the last attempt StageFailed is raised and the caller decides what to
+    keep on screen; exceptions never leave a stage any other way.
+    """
+
+    def __init__(self, name, retries=0, backoff=1.0, on_fault=None):
+        self.name = name
+        self.retries = retries
+        self.backoff = backoff
+        self.on_fault = on_fault
+        # Consecutive runs that ended in StageFailed
+        self.failures = 0
+
+    def run(self, func, *args, **kwargs):
+        for attempt in range(self.retries + 1):
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.retries:
+                    self.failures += 1
+                    logger.error(f"{self.name} failed ({self.failures} in a row): {e}", exc_info=True)
+                    raise StageFailed(self.name, e) from e
+                logger.warning(f"{self.name} failed, retrying ({attempt + 1}/{self.retries}): {e}")
+                time.sleep(self.backoff * 2 ** attempt)
+                if self.on_fault is not None:
+                    try:
+                        self.on_fault(e)
+                    except Exception as fault_error:
+                        logger.error(f"{self.name} recovery failed: {fault_error}")
+                continue
+            self.failures = 0
+            return result
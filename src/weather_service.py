@@ -1,41 +1,195 @@
-import requests
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    from src.locations import grid_cell, cell_center
+    from src.providers import RateLimited, create_providers
+except ImportError:
+    from locations import grid_cell, cell_center
+    from providers import RateLimited, create_providers
+
+logger = logging.getLogger(__name__)
+
+# Threads for hedged requests; a slow request keeps its thread until it times out
+HEDGE_WORKERS = 4
+
+class FetchFailed(Exception):
+    """Every provider that was tried failed; raised only when the caller asked for errors."""
+
+class _Flight:
+    # One in-progress fetch that concurrent callers wait on
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
 
 class WeatherService:
-    def __init__(self, lat=40.7128, lon=-74.0060): # Default to New York
+    def __init__(self, lat=40.7128, lon=-74.0060, cache_ttl=0, grid_cell_size=None, budget=None, providers=None): # Default to New York
         self.lat = lat
         self.lon = lon
-        self.base_url = "https://api.open-meteo.com/v1/forecast"
-
-    def get_current_weather(self, lat=None, lon=None):
-        params = {
-            "latitude": lat if lat is not None else self.lat,
-            "longitude": lon if lon is not None else self.lon,
-            "current": "temperature_2m,apparent_temperature,relative_humidity_2m,weather_code,wind_speed_10m,wind_direction_10m",
-            "daily": "weathercode,temperature_2m_max,temperature_2m_min,sunrise,sunset",
-            "timezone": "auto"
-        }
+        # Seconds a fetched forecast is reused; lets several panels share one fetch
+        self.cache_ttl = cache_ttl
+        # When set, locations are snapped to grid cells and each cell is fetched
+        # once, at its center, no matter how many sites fall inside it
+        self.grid_cell_size = grid_cell_size
+        self.wind_speed_unit = "kmh"
+        # Optional ApiBudget for the public Open-Meteo API
+        self.budget = budget
+        # In order of preference; later ones hedge slow requests and take over on failure
+        self.providers = providers or create_providers(None, budget)
+        self._executor = None
+        self._cache = {}
+        self._inflight = {}
+        self._cache_lock = threading.Lock()
+
+    def configure_providers(self, specs):
+        """Replaces the providers from config entries (see create_providers)."""
+        self.providers = create_providers(specs, self.budget)
+
+    def get_current_weather(self, lat=None, lon=None, priority=0, fallback=True):
+        """Returns the forecast for lat/lon, or None if there is none to show.
+
+        Concurrent calls for the same location share one request. When no
+        provider can be used (budget, rate limit or errors), the last cached
+        forecast is returned even if it has expired. priority > 0 marks
+        locations that give way first when the budget runs low.
+
+        With fallback=False, provider errors raise FetchFailed instead, so a
+        caller can retry and fall back to stale_weather() itself; a fetch
+        refused by the budget or a rate limit still falls back, as retrying
+        it would not help.
+        """
+        key, lat, lon = self._key(lat, lon)
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.cache_ttl:
+                return entry[1]
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                if not fallback:
+                    raise flight.error
+                return self.stale_weather(lat, lon)
+            return flight.result
+
         try:
-            response = requests.get(self.base_url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Transform to match expected format
-            current_data = data.get("current", {})
-            return {
-                "current": {
-                    "temperature": current_data.get("temperature_2m"),
-                    "apparent_temperature": current_data.get("apparent_temperature"),
-                    "windspeed": current_data.get("wind_speed_10m"),
-                    "winddirection": current_data.get("wind_direction_10m"),
-                    "weathercode": current_data.get("weather_code"),
-                    "is_day": 1 if current_data.get("is_day") else 0,
-                    "time": current_data.get("time")
-                },
-                "daily": data.get("daily")
-            }
-        except Exception as e:
-            print(f"Error fetching weather: {e}")
+            try:
+                weather = self.fetch_weather(lat, lon, priority)
+            except FetchFailed as e:
+                flight.error = e
+                if not fallback:
+                    raise
+                weather = None
+            if weather is not None:
+                # Stored even without a TTL, as the fallback when fetches are refused
+                with self._cache_lock:
+                    self._cache[key] = (time.monotonic(), weather)
+            elif entry is not None:
+                # Degrade to the stale forecast rather than nothing
+                logger.warning("No fresh forecast available; showing cached weather")
+                weather = entry[1]
+            flight.result = weather
+            return weather
+        finally:
+            with self._cache_lock:
+                del self._inflight[key]
+            flight.done.set()
+
+    def stale_weather(self, lat=None, lon=None):
+        """Returns the last forecast fetched for lat/lon whatever its age, or None."""
+        key, _, _ = self._key(lat, lon)
+        with self._cache_lock:
+            entry = self._cache.get(key)
+        if entry is None:
+            return None
+        logger.warning("No fresh forecast available; showing cached weather")
+        return entry[1]
+
+    def _key(self, lat, lon):
+        # Cache key and the coordinates actually fetched
+        lat = lat if lat is not None else self.lat
+        lon = lon if lon is not None else self.lon
+        if self.grid_cell_size:
+            key = grid_cell(lat, lon, self.grid_cell_size)
+            lat, lon = cell_center(key, self.grid_cell_size)
+        else:
+            key = (round(lat, 4), round(lon, 4))
+        return key, lat, lon
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+    def fetch_weather(self, lat, lon, priority=0):
+        """Fetches from the first usable provider, hedging with the next if it is slow.
+
+        When the primary has not answered within its recent latency
+        percentile, or fails, the same request goes to the next provider and
+        the first forecast to arrive wins. Returns None if no provider could
+        be used, and raises FetchFailed if the ones tried all failed.
+        """
+        candidates = iter(self.providers)
+        primary = self._next_provider(candidates, priority)
+        if primary is None:
+            logger.warning("API budget low or rate limited; not fetching")
             return None
+        if len(self.providers) == 1:
+            return self._fetch_from(primary, lat, lon)
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="weather-fetch")
+        pending = {self._executor.submit(self._fetch_from, primary, lat, lon)}
+        delay = primary.hedge_delay()
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    weather = future.result()
+                except FetchFailed as e:
+                    error = e
+                    continue
+                if weather is not None:
+                    return weather
+            provider = self._next_provider(candidates, priority)
+            if provider is None:
+                # Nothing left to try; wait for the requests still out
+                delay = None
+                continue
+            if not done:
+                logger.warning(f"{primary.name} is slow; hedging with {provider.name}")
+            pending.add(self._executor.submit(self._fetch_from, provider, lat, lon))
+            delay = provider.hedge_delay()
+        if error is not None:
+            raise error
+        return None
+
+    def _next_provider(self, candidates, priority):
+        for provider in candidates:
+            if provider.acquire(priority):
+                return provider
+        return None
+
+    def _fetch_from(self, provider, lat, lon):
+        started = time.monotonic()
+        try:
+            weather = provider.fetch(lat, lon, self.wind_speed_unit)
+        except RateLimited as e:
+            logger.warning(f"{provider.name} rate limited; pausing its requests")
+            provider.rate_limited(e.retry_after)
+            return None
+        except Exception as e:
+            logger.error(f"Error fetching weather from {provider.name}: {e}")
+            raise FetchFailed(f"{provider.name}: {e}") from e
+        provider.latency.record(time.monotonic() - started)
+        return weather
 
 if __name__ == "__main__":
     ws = WeatherService()